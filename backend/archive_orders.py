@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Move delivered orders older than N days from `orders` into `orders_archive`.
+Safe to run repeatedly, e.g. nightly from cron.
+"""
+import argparse
+
+from server import ARCHIVE_AFTER_DAYS, archive_orders
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive orders older than this many days")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    moved = archive_orders(older_than_days=args.days, batch_size=args.batch_size)
+    print(f"Archived {moved} orders")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Benchmark dispatch batching on synthetic pending orders scattered around a hub
+"""
+import sys
+import time
+import uuid
+
+import numpy as np
+
+from dispatch import plan_batches
+
+HUB = (12.9716, 77.5946)
+
+def synthetic_orders(count: int, slots: int = 4, radius_km: float = 12.0, seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    # Uniform over a disc, roughly 111km per degree
+    distance = radius_km * np.sqrt(rng.random(count)) / 111.0
+    bearing = rng.random(count) * 2 * np.pi
+    lat = HUB[0] + distance * np.sin(bearing)
+    lng = HUB[1] + distance * np.cos(bearing) / np.cos(np.radians(HUB[0]))
+    slot = rng.integers(0, slots, count)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "delivery_location": {"lat": float(lat[i]), "lng": float(lng[i])},
+            "delivery_slot": {"id": f"slot-{slot[i]}"},
+        }
+        for i in range(count)
+    ]
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 1000, 2500, 5000, 10000]
+    for size in sizes:
+        orders = synthetic_orders(size)
+        started = time.perf_counter()
+        plan = plan_batches(orders, HUB, max_stops=12)
+        elapsed = (time.perf_counter() - started) * 1000
+        total_km = sum(batch["route_km"] for batch in plan["batches"])
+        print(f"{size:>6} orders -> {len(plan['batches']):>4} batches, {total_km:>9.1f} km total, {elapsed:>8.1f} ms")
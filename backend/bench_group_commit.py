@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark order inserts at a fixed arrival rate: one insert_one per order versus the
+group-commit writer. Runs against MONGO_URL and writes to a scratch `bench_orders` collection.
+"""
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from group_commit import GroupCommitWriter
+from server import db
+
+def synthetic_order() -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "customer_id": str(uuid.uuid4()),
+        "items": [{"product_id": "product-1", "quantity": 2, "price": 320.0, "name": "Chicken Curry Cut"}],
+        "total_amount": 640.0,
+        "status": "pending",
+        "created_at": datetime.utcnow(),
+    }
+
+def run(insert, rate: int, seconds: float, concurrency: int) -> dict:
+    total = int(rate * seconds)
+    latencies = []
+
+    def place(scheduled_at: float):
+        insert(synthetic_order())
+        latencies.append(time.perf_counter() - scheduled_at)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            # Open loop: arrivals keep their schedule even when the writer falls behind
+            scheduled_at = started + i / rate
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(place, scheduled_at)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "orders": total,
+        "throughput": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=1000, help="orders per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64, help="simulated request threads")
+    parser.add_argument("--delay-ms", type=float, default=5, help="group-commit window")
+    parser.add_argument("--max-batch", type=int, default=100)
+    args = parser.parse_args()
+
+    collection = db.bench_orders
+    collection.drop()
+    collection.create_index("id", unique=True)
+    writer = GroupCommitWriter(lambda: collection, max_batch=args.max_batch, max_delay=args.delay_ms / 1000)
+    try:
+        for name, insert in (("insert_one", collection.insert_one), ("group commit", writer.insert)):
+            result = run(insert, args.rate, args.seconds, args.concurrency)
+            print(
+                f"{name:>12}: {result['orders']} orders, {result['throughput']:.0f} orders/s, "
+                f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+            )
+    finally:
+        collection.drop()
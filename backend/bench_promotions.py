@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark promotion evaluation: a 30-line cart against 1,000 active rules
+"""
+import random
+import time
+
+from promotions import PromotionEngine
+
+def synthetic_rules(count: int, products: list, categories: list) -> list:
+    rules = []
+    for i in range(count):
+        kind = random.choice(["percent_off", "percent_off", "buy_x_get_y", "coupon"])
+        rule = {"id": f"rule-{i}", "name": f"Rule {i}", "type": kind, "active": True}
+        if kind == "coupon":
+            rule.update(code=f"SAVE{i}", percent_off=10, max_discount=200, min_cart_total=0)
+        else:
+            scope = {"product_id": random.choice(products)} if random.random() < 0.7 else {"category": random.choice(categories)}
+            rule.update(scope)
+            if kind == "percent_off":
+                rule["percent_off"] = random.choice([5, 10, 15, 20])
+            else:
+                rule.update(buy_quantity=2, free_quantity=1)
+        rules.append(rule)
+    return rules
+
+def synthetic_cart(lines: int, products: list, categories: list) -> list:
+    return [
+        {
+            "product_id": product_id,
+            "category": random.choice(categories),
+            "quantity": random.randint(1, 4),
+            "price": float(random.randint(99, 999)),
+        }
+        for product_id in random.sample(products, lines)
+    ]
+
+if __name__ == "__main__":
+    random.seed(7)
+    products = [f"product-{i}" for i in range(500)]
+    categories = ["chicken", "mutton", "fish", "seafood", "eggs", "marinades"]
+    rules = synthetic_rules(1000, products, categories)
+
+    started = time.perf_counter()
+    engine = PromotionEngine(rules)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    carts = [synthetic_cart(30, products, categories) for _ in range(200)]
+    coupon = next(rule["code"] for rule in rules if rule["type"] == "coupon")
+    iterations = 5000
+    started = time.perf_counter()
+    for i in range(iterations):
+        engine.evaluate(carts[i % len(carts)], coupon)
+    per_cart_us = (time.perf_counter() - started) / iterations * 1e6
+
+    print(f"compile 1,000 rules: {compile_ms:.2f} ms")
+    print(f"evaluate 30-line cart + coupon: {per_cart_us:.1f} us per cart")
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+Run one-time database bootstrapping (indexes, default admin) before starting API workers.
+Deploy with BOOTSTRAP_ON_STARTUP=false to keep it out of worker startup entirely.
+"""
+import sys
+
+from server import bootstrap
+
+if __name__ == "__main__":
+    ran = bootstrap(force="--force" in sys.argv)
+    print("Bootstrap completed" if ran else "Bootstrap already up to date (use --force to rerun)")
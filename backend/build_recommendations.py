@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Build "frequently bought together" neighbours from order history.
+Without --full, only orders placed since the last run are folded into the stored
+co-occurrence rows, and only the products they touch are re-ranked and rewritten.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from recommendations import CooccurrenceModel
+from server import db
+
+TOP_K = 20
+# Orders younger than this may still be in flight from other workers
+SETTLE_SECONDS = 60
+
+def order_stream(query: dict):
+    projection = {"_id": 0, "id": 1, "items.product_id": 1, "created_at": 1}
+    yield from db.orders_archive.find(query, projection)
+    yield from db.orders.find(query, projection)
+
+def save(model: CooccurrenceModel, products, watermark: datetime, replace: bool = False):
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne({"product_id": row["product_id"]}, {"$set": {**row, "updated_at": now}}, upsert=True)
+        for row in model.ranked(products)
+    ]
+    if replace:
+        db.product_cooccurrence.delete_many({"product_id": {"$nin": list(products)}})
+    for start in range(0, len(operations), 1000):
+        db.product_cooccurrence.bulk_write(operations[start:start + 1000], ordered=False)
+    db.meta.update_one(
+        {"_id": "recommendations"},
+        {"$set": {"watermark": watermark, "built_at": now}, "$inc": {"version": 1}},
+        upsert=True
+    )
+
+def full_build(top_k: int) -> int:
+    watermark = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    orders = list(order_stream({"created_at": {"$lte": watermark}}))
+    model = CooccurrenceModel.from_orders(orders, top_k)
+    save(model, model.counts.keys(), watermark, replace=True)
+    return len(orders)
+
+def incremental_build(top_k: int) -> int:
+    meta = db.meta.find_one({"_id": "recommendations"}) or {}
+    if not meta.get("watermark"):
+        return full_build(top_k)
+    watermark = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    orders = list(db.orders.find(
+        {"created_at": {"$gt": meta["watermark"], "$lte": watermark}},
+        {"_id": 0, "id": 1, "items.product_id": 1}
+    ))
+    touched = list({item["product_id"] for order in orders for item in order.get("items") or []})
+    if not touched:
+        return 0
+    model = CooccurrenceModel.from_rows(db.product_cooccurrence.find({"product_id": {"$in": touched}}, {"_id": 0}), top_k)
+    for order in orders:
+        model.add_order(order)
+    save(model, touched, watermark)
+    return len(orders)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--full", action="store_true", help="rebuild from all hot and archived orders")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+    processed = full_build(args.top_k) if args.full else incremental_build(args.top_k)
+    print(f"Processed {processed} orders")
@@ -0,0 +1,82 @@
+"""
+Dispatch batching: groups pending orders into rider runs.
+Orders are swept by polar angle around the hub (one vectorized pass and a sort), cut into
+runs of at most `max_stops`, and each run is sequenced nearest-neighbour over its own small
+distance matrix. The cost is O(n log n) overall, so thousands of orders per hub plan in well
+under a second.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def distance_matrix(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    return haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+
+
+def sweep_runs(lat: np.ndarray, lng: np.ndarray, hub: Tuple[float, float], max_stops: int) -> List[np.ndarray]:
+    if len(lat) == 0:
+        return []
+    # Equirectangular offsets are accurate enough to order points by bearing from the hub
+    dx = (lng - hub[1]) * np.cos(np.radians(hub[0]))
+    dy = lat - hub[0]
+    angles = np.arctan2(dy, dx)
+    order = np.argsort(angles)
+    # Start the sweep at the widest angular gap so a cluster is not split across the seam
+    sorted_angles = angles[order]
+    gaps = np.diff(np.append(sorted_angles, sorted_angles[0] + 2 * np.pi))
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    return [order[i:i + max_stops] for i in range(0, len(order), max_stops)]
+
+
+def sequence_run(lat: np.ndarray, lng: np.ndarray, hub: Tuple[float, float]) -> Tuple[List[int], float]:
+    """Nearest-neighbour stop order for one run; returns positions into `lat`/`lng` and the route length."""
+    matrix = distance_matrix(lat, lng)
+    from_hub = haversine_km(hub[0], hub[1], lat, lng)
+    current = int(np.argmin(from_hub))
+    route, total = [current], float(from_hub[current])
+    visited = np.zeros(len(lat), dtype=bool)
+    visited[current] = True
+    for _ in range(len(lat) - 1):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(distances))
+        total += float(distances[current])
+        visited[current] = True
+        route.append(current)
+    total += float(from_hub[current])
+    return route, total
+
+
+def plan_batches(orders: List[dict], hub: Tuple[float, float], max_stops: int = 12) -> Dict[str, list]:
+    """Plan rider runs for orders carrying `delivery_location`, keeping delivery slots apart."""
+    by_slot: Dict[str, List[dict]] = {}
+    unroutable = []
+    for order in orders:
+        location = order.get("delivery_location")
+        if not location:
+            unroutable.append(order["id"])
+            continue
+        slot_id = (order.get("delivery_slot") or {}).get("id")
+        by_slot.setdefault(slot_id, []).append(order)
+
+    batches = []
+    for slot_id, slot_orders in by_slot.items():
+        lat = np.array([o["delivery_location"]["lat"] for o in slot_orders], dtype=float)
+        lng = np.array([o["delivery_location"]["lng"] for o in slot_orders], dtype=float)
+        for run in sweep_runs(lat, lng, hub, max_stops):
+            route, distance = sequence_run(lat[run], lng[run], hub)
+            batches.append({
+                "delivery_slot_id": slot_id,
+                "order_ids": [slot_orders[run[i]]["id"] for i in route],
+                "stops": len(route),
+                "route_km": round(distance, 2),
+            })
+    return {"batches": batches, "unroutable_order_ids": unroutable}
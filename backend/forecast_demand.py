@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Forecast per-SKU demand from order history and store recommended reorder quantities.
+Daily sales are aggregated in MongoDB and streamed into one matrix, then every SKU is
+fitted at once (see forecasting.py). Besides the global forecast against products.stock,
+each hub gets its own, fitted on the orders it shipped and planned against its inventory.
+Results are served by /api/admin/forecast/reorder (?hub_id= for a hub).
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from forecasting import forecast, history_window, reorder_quantities, sales_matrix
+from server import DELIVERY_TIMEZONE, db, local_now, reporting_db
+
+def local_midnight_utc(day) -> datetime:
+    local = datetime(day.year, day.month, day.day, tzinfo=DELIVERY_TIMEZONE)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+def daily_sales(start, end):
+    pipeline = [
+        {"$match": {
+            "created_at": {"$gte": local_midnight_utc(start), "$lt": local_midnight_utc(end + timedelta(days=1))},
+            "status": {"$ne": "cancelled"}
+        }},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {
+                "hub_id": "$hub_id",
+                "product_id": "$items.product_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": DELIVERY_TIMEZONE.key}}
+            },
+            "quantity": {"$sum": "$items.quantity"}
+        }},
+    ]
+    for collection in (reporting_db.orders, reporting_db.orders_archive):
+        for row in collection.aggregate(pipeline, allowDiskUse=True, batchSize=5000):
+            yield {
+                "hub_id": row["_id"].get("hub_id"),
+                "product_id": row["_id"]["product_id"],
+                "day": row["_id"]["day"],
+                "quantity": row["quantity"]
+            }
+
+def fit(rows, start, end, stock: dict, history_days: int, horizon_days: int, aggregate_ms: float, hub_id=None) -> dict:
+    started = time.perf_counter()
+    product_ids, days, sales = sales_matrix(rows, start, end, sorted(stock))
+    predicted, sigma = forecast(sales, days, horizon=horizon_days)
+    result = {
+        "_id": f"latest:{hub_id}" if hub_id else "latest",
+        "hub_id": hub_id,
+        "generated_at": datetime.utcnow(),
+        "history_days": history_days,
+        "horizon_days": horizon_days,
+        "items": reorder_quantities(product_ids, predicted, sigma, stock),
+        "timings_ms": {"aggregate": aggregate_ms, "fit": round((time.perf_counter() - started) * 1000, 1)}
+    }
+    db.stock_forecasts.replace_one({"_id": result["_id"]}, result, upsert=True)
+    return result
+
+def run(history_days: int, horizon_days: int) -> list:
+    started = time.perf_counter()
+    start, end = history_window(history_days, local_now().date())
+    # One aggregation pass for every hub; rows are split per hub in memory
+    rows = list(daily_sales(start, end))
+    aggregate_ms = round((time.perf_counter() - started) * 1000, 1)
+    
+    products = {p["id"]: p.get("stock", 0) for p in db.products.find({}, {"_id": 0, "id": 1, "stock": 1})}
+    results = [fit(rows, start, end, products, history_days, horizon_days, aggregate_ms)]
+    for hub in db.hubs.find({"active": True}, {"_id": 0, "id": 1}):
+        stock = dict.fromkeys(products, 0)
+        stock.update(
+            (level["product_id"], level["stock"])
+            for level in db.inventory.find({"hub_id": hub["id"]}, {"_id": 0, "product_id": 1, "stock": 1})
+            if level["product_id"] in products
+        )
+        hub_rows = [row for row in rows if row["hub_id"] == hub["id"]]
+        results.append(fit(hub_rows, start, end, stock, history_days, horizon_days, aggregate_ms, hub["id"]))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--horizon-days", type=int, default=1, help="days of demand to cover with this order")
+    args = parser.parse_args()
+    for result in run(args.history_days, args.horizon_days):
+        print(f"Forecast {len(result['items'])} products for {result['hub_id'] or 'all stock'}: {result['timings_ms']}")
@@ -0,0 +1,82 @@
+"""
+Vectorized demand forecasting for stock planning.
+Daily sales are pivoted into a (SKU x day) matrix and every SKU is fitted at once:
+a weekly seasonal profile from the recent weeks, simple exponential smoothing on the
+deseasonalized series (one vector update per day across all SKUs), and a residual-based
+safety stock for the reorder recommendation.
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def sales_matrix(rows: Iterable[dict], start: date, end: date, product_ids: Optional[List[str]] = None):
+    """Pivot aggregated {product_id, day, quantity} rows into a dense matrix; missing days are zero sales."""
+    days = pd.date_range(start, end, freq="D")
+    frame = pd.DataFrame(list(rows), columns=["product_id", "day", "quantity"])
+    frame["day"] = pd.to_datetime(frame["day"])
+    matrix = frame.pivot_table(index="product_id", columns="day", values="quantity", aggfunc="sum", fill_value=0)
+    matrix = matrix.reindex(columns=days, fill_value=0)
+    if product_ids is not None:
+        matrix = matrix.reindex(index=product_ids, fill_value=0)
+    return list(matrix.index), days, matrix.to_numpy(dtype=float)
+
+
+def forecast(sales: np.ndarray, days: pd.DatetimeIndex, horizon: int = 1, alpha: float = 0.3, season_weeks: int = 8):
+    """Return (forecast per SKU per horizon day, residual std per SKU)."""
+    n_sku, n_days = sales.shape
+    weekday = days.weekday.to_numpy()
+
+    # Weekly profile over the recent weeks, normalised so an average weekday is 1.0
+    recent = slice(max(0, n_days - 7 * season_weeks), n_days)
+    totals = np.zeros((n_sku, 7))
+    counts = np.zeros(7)
+    np.add.at(totals.T, weekday[recent], sales[:, recent].T)
+    np.add.at(counts, weekday[recent], 1)
+    weekday_mean = totals / np.maximum(counts, 1)
+    overall = weekday_mean.mean(axis=1, keepdims=True)
+    season = np.where(overall > 0, weekday_mean / np.where(overall > 0, overall, 1), 1.0)
+    season = np.where(season > 0, season, 1.0)
+
+    deseasonalized = sales / season[:, weekday]
+    level = deseasonalized[:, 0].copy()
+    residuals = np.zeros_like(sales)
+    for t in range(1, n_days):
+        residuals[:, t] = sales[:, t] - level * season[:, weekday[t]]
+        level += alpha * (deseasonalized[:, t] - level)
+
+    future_weekdays = (weekday[-1] + 1 + np.arange(horizon)) % 7
+    predicted = level[:, None] * season[:, future_weekdays]
+    sigma = residuals[:, -28:].std(axis=1) if n_days > 1 else np.zeros(n_sku)
+    return np.maximum(predicted, 0), sigma
+
+
+def reorder_quantities(
+    product_ids: List[str],
+    predicted: np.ndarray,
+    sigma: np.ndarray,
+    stock: Dict[str, int],
+    service_z: float = 1.65,
+) -> List[dict]:
+    horizon = predicted.shape[1]
+    demand = predicted.sum(axis=1)
+    safety = service_z * sigma * np.sqrt(horizon)
+    on_hand = np.array([stock.get(product_id, 0) for product_id in product_ids], dtype=float)
+    reorder = np.maximum(np.ceil(demand + safety - on_hand), 0)
+    return [
+        {
+            "product_id": product_id,
+            "forecast_demand": round(float(demand[i]), 2),
+            "safety_stock": round(float(safety[i]), 2),
+            "stock": int(on_hand[i]),
+            "reorder_quantity": int(reorder[i]),
+        }
+        for i, product_id in enumerate(product_ids)
+    ]
+
+
+def history_window(history_days: int, today: date) -> Tuple[date, date]:
+    end = today - timedelta(days=1)
+    return end - timedelta(days=history_days - 1), end
@@ -0,0 +1,112 @@
+"""
+Group-commit writer for bursty inserts.
+Callers on many threads hand documents to a single flusher thread, which waits up to
+`max_delay` seconds (or until `max_batch` documents are queued) and writes the whole group
+with one unordered `insert_many`. Each caller blocks on its own future and gets back either
+success or the error for its own document, so one duplicate does not fail its neighbours.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, List, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteConcernError
+
+
+class GroupCommitWriter:
+    def __init__(self, collection: Callable, max_batch: int = 100, max_delay: float = 0.005, timeout: float = 30.0):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue: "queue.Queue[Tuple[dict, Future]]" = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # The flusher thread does not survive a fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def submit(self, document: dict) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((document, future))
+        return future
+
+    def insert(self, document: dict):
+        """Insert `document` as part of the next group and wait for that group's write.
+
+        Raises TimeoutError only when the document was withdrawn unwritten; once its group is
+        being written the caller waits for the real outcome, so a timeout never hides a write.
+        """
+        future = self.submit(document)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Wait for everything queued so far to be written; False if some is still pending."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Documents whose caller gave up while queued are dropped; the rest can no longer be withdrawn
+            live = [(document, future) for document, future in batch if future.set_running_or_notify_cancel()]
+            if live:
+                self.flush(live)
+            for _ in batch:
+                pending.task_done()
+
+    def flush(self, batch: List[Tuple[dict, Future]]):
+        try:
+            self.collection().insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            details = e.details or {}
+            failed = {error["index"]: error for error in details.get("writeErrors", [])}
+            concern_errors = details.get("writeConcernErrors") or []
+            for index, (_, future) in enumerate(batch):
+                error = failed.get(index)
+                if error is not None:
+                    error_type = DuplicateKeyError if error.get("code") == 11000 else OperationFailure
+                    future.set_exception(error_type(error.get("errmsg"), error.get("code"), error))
+                elif concern_errors:
+                    concern = concern_errors[0]
+                    future.set_exception(WriteConcernError(concern.get("errmsg"), concern.get("code"), concern))
+                else:
+                    future.set_result(None)
+            return
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for _, future in batch:
+            future.set_result(None)
@@ -0,0 +1,158 @@
+"""
+Order invoices.
+An invoice is rendered from a plain payload (order lines, totals, customer and seller details)
+into a self-contained HTML page. Payloads are content-addressed: the sha256 of the payload and
+the template version names the cached file and doubles as the ETag, so a repeat request can be
+answered from the hash alone and a changed order never serves a stale invoice.
+Rendering runs in a process pool so it never holds the event loop or the GIL of the API worker.
+"""
+import asyncio
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+TEMPLATE_VERSION = "1"
+
+
+def invoice_payload(order: dict, customer: Optional[dict], seller: dict) -> dict:
+    """Everything the invoice shows and nothing else, so unrelated order changes keep the same key."""
+    customer = customer or {}
+    return {
+        "order_id": order["id"],
+        "created_at": order.get("created_at"),
+        "items": [
+            {
+                "name": item.get("name") or item["product_id"],
+                "weight": item.get("weight"),
+                "quantity": item["quantity"],
+                "price": item["price"],
+            }
+            for item in order["items"]
+        ],
+        "discounts": [
+            {"name": discount.get("name") or discount.get("code"), "amount": discount["amount"]}
+            for discount in order.get("discounts") or []
+        ],
+        "total_amount": order["total_amount"],
+        "delivery_slot": order.get("delivery_slot"),
+        "customer": {key: customer.get(key) for key in ("name", "email", "phone")},
+        "seller": seller,
+    }
+
+
+def invoice_key(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(f"{TEMPLATE_VERSION}:{canonical}".encode("utf-8")).hexdigest()
+
+
+def money(amount: float) -> str:
+    return f"&#8377;{amount:,.2f}"
+
+
+def render_invoice(payload: dict) -> bytes:
+    escape = lambda value: html.escape(str(value)) if value is not None else ""
+    subtotal = sum(item["price"] * item["quantity"] for item in payload["items"])
+    rows = "".join(
+        f"<tr><td>{escape(item['name'])}</td><td>{escape(item['weight'])}</td>"
+        f"<td class=num>{item['quantity']}</td><td class=num>{money(item['price'])}</td>"
+        f"<td class=num>{money(item['price'] * item['quantity'])}</td></tr>"
+        for item in payload["items"]
+    )
+    discounts = "".join(
+        f"<tr><td colspan=4>{escape(discount['name'])}</td><td class=num>-{money(discount['amount'])}</td></tr>"
+        for discount in payload["discounts"]
+    )
+    slot = payload.get("delivery_slot")
+    slot_line = f"<p>Delivery: {escape(slot['date'])} {escape(slot['start'])}&ndash;{escape(slot['end'])}</p>" if slot else ""
+    seller, customer = payload["seller"], payload["customer"]
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Invoice {escape(payload['order_id'])}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border-bottom: 1px solid #ddd; padding: 6px; text-align: left; }}
+.num {{ text-align: right; }}
+tfoot td {{ font-weight: bold; }}
+</style></head><body>
+<h1>Tax Invoice</h1>
+<p><strong>{escape(seller.get('name'))}</strong><br>{escape(seller.get('address'))}<br>{escape(seller.get('tax_id'))}</p>
+<p>Invoice for order {escape(payload['order_id'])}<br>Date: {escape(payload['created_at'])}</p>
+<p>Billed to: {escape(customer.get('name'))}<br>{escape(customer.get('email'))}<br>{escape(customer.get('phone'))}</p>
+{slot_line}
+<table>
+<thead><tr><th>Item</th><th>Weight</th><th class=num>Qty</th><th class=num>Price</th><th class=num>Amount</th></tr></thead>
+<tbody>{rows}</tbody>
+<tfoot>
+<tr><td colspan=4>Subtotal</td><td class=num>{money(subtotal)}</td></tr>
+{discounts}
+<tr><td colspan=4>Total</td><td class=num>{money(payload['total_amount'])}</td></tr>
+</tfoot>
+</table>
+</body></html>
+"""
+    return page.encode("utf-8")
+
+
+class InvoiceStore:
+    """Content-addressed invoice files under `directory`, rendered on a lazily created process pool."""
+
+    def __init__(self, directory: str, workers: int = 2):
+        self.directory = directory
+        self.workers = workers
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def pool(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the API worker has Mongo and logging threads a fork would copy mid-flight
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.html")
+
+    def cached(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, key: str, content: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a concurrent reader never sees a partial file
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    async def get(self, payload: dict, key: str) -> bytes:
+        # File reads and writes go to a thread, rendering to the process pool: nothing blocks the loop
+        content = await asyncio.to_thread(self.cached, key)
+        if content is None:
+            content = await asyncio.wrap_future(self.pool().submit(render_invoice, payload))
+            await asyncio.to_thread(self.store, key, content)
+        return content
+
+    def ensure(self, payload: dict) -> str:
+        """Blocking render-if-missing for background pre-generation; returns the key."""
+        key = invoice_key(payload)
+        if not os.path.exists(self.path(key)):
+            self.store(key, self.pool().submit(render_invoice, payload).result())
+        return key
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
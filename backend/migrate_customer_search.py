@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Backfill the normalized search fields used by /api/admin/customers/search onto existing customers
+"""
+import sys
+
+from pymongo import UpdateOne
+
+from server import customer_search_fields, db
+
+BATCH_SIZE = 1000
+
+def backfill(batch_size: int = BATCH_SIZE) -> int:
+    updated = 0
+    cursor = db.customers.find(
+        {"search_name_tokens": {"$exists": False}},
+        {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1}
+    )
+    operations = []
+    for customer in cursor:
+        operations.append(UpdateOne({"id": customer["id"]}, {"$set": customer_search_fields(customer)}))
+        if len(operations) >= batch_size:
+            db.customers.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        db.customers.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE
+    print(f"Backfilled search fields on {backfill(batch_size)} customers")
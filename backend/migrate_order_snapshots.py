@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Backfill product snapshots (name, category, weight, thumbnail) onto existing order line items
+"""
+import sys
+
+from pymongo import UpdateOne
+
+from server import db, product_snapshot
+
+BATCH_SIZE = 500
+
+def backfill(batch_size: int = BATCH_SIZE) -> int:
+    updated = 0
+    cursor = db.orders.find({"items": {"$elemMatch": {"name": {"$exists": False}}}}, {"_id": 0, "id": 1, "items": 1})
+    batch = []
+    for order in cursor:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            updated += flush(batch)
+            batch = []
+    if batch:
+        updated += flush(batch)
+    return updated
+
+def flush(orders: list) -> int:
+    product_ids = list({item["product_id"] for order in orders for item in order["items"]})
+    products = {
+        p["id"]: p for p in db.products.find(
+            {"id": {"$in": product_ids}},
+            {"_id": 0, "id": 1, "name": 1, "category": 1, "weight": 1, "image": 1}
+        )
+    }
+    operations = []
+    for order in orders:
+        items = []
+        for item in order["items"]:
+            product = products.get(item["product_id"])
+            if "name" not in item:
+                # Deleted products keep explicit nulls so the line is not revisited
+                item.update(product_snapshot(product) if product else {"name": None, "category": None, "weight": None, "thumbnail": None})
+            items.append(item)
+        operations.append(UpdateOne({"id": order["id"]}, {"$set": {"items": items}}))
+    if operations:
+        db.orders.bulk_write(operations, ordered=False)
+    return len(operations)
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE
+    print(f"Backfilled product snapshots on {backfill(batch_size)} orders")
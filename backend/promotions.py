@@ -0,0 +1,124 @@
+"""
+Promotion and coupon engine.
+Rules are compiled once into indexes keyed by product id, category and coupon code, so
+evaluating a cart only visits the rules that can match each line: O(lines + matching rules)
+regardless of how many promotions are active overall. Percent-off rules under each key are
+pre-sorted by discount and buy-X-get-Y rules are grouped by their (buy, free) shape, so only
+the first live rule of each group needs to be priced.
+
+Rule types:
+- percent_off: `percent_off` on lines matching `product_id` or `category`
+- buy_x_get_y: every `buy_quantity` + `free_quantity` units of a matching line, `free_quantity` are free
+- coupon: `code` taking `percent_off` (optionally capped by `max_discount`) or `amount_off` off the
+  discounted subtotal, subject to `min_cart_total`
+Each line gets the single best line-level promotion; a coupon applies on top.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROMOTION_TYPES = ("percent_off", "buy_x_get_y", "coupon")
+
+
+class PromotionError(ValueError):
+    pass
+
+
+def is_live(rule: dict, now: datetime) -> bool:
+    starts_at, ends_at = rule.get("starts_at"), rule.get("ends_at")
+    return (starts_at is None or starts_at <= now) and (ends_at is None or now < ends_at)
+
+
+def line_discount(rule: dict, line: dict) -> float:
+    quantity, price = line["quantity"], line["price"]
+    if rule["type"] == "percent_off":
+        return price * quantity * rule["percent_off"] / 100
+    if rule["type"] == "buy_x_get_y":
+        group = rule["buy_quantity"] + rule["free_quantity"]
+        return price * (quantity // group) * rule["free_quantity"]
+    return 0.0
+
+
+class PromotionEngine:
+    def __init__(self, rules: List[dict]):
+        # key -> {"percent_off": [rules, highest first], "buy_x_get_y": {(buy, free): [rules]}}
+        self.by_product: Dict[str, Dict[str, List[dict]]] = {}
+        self.by_category: Dict[str, Dict[str, List[dict]]] = {}
+        self.coupons: Dict[str, dict] = {}
+        for rule in rules:
+            if rule.get("active", True):
+                self._compile(rule)
+        for index in (self.by_product, self.by_category):
+            for buckets in index.values():
+                buckets["percent_off"].sort(key=lambda rule: rule["percent_off"], reverse=True)
+
+    def _compile(self, rule: dict):
+        if rule["type"] == "coupon":
+            self.coupons[rule["code"].strip().upper()] = rule
+            return
+        if rule.get("product_id"):
+            index, key = self.by_product, rule["product_id"]
+        elif rule.get("category"):
+            index, key = self.by_category, rule["category"]
+        else:
+            return
+        buckets = index.setdefault(key, {"percent_off": [], "buy_x_get_y": {}})
+        if rule["type"] == "percent_off":
+            buckets["percent_off"].append(rule)
+        else:
+            shape = (rule["buy_quantity"], rule["free_quantity"])
+            buckets["buy_x_get_y"].setdefault(shape, []).append(rule)
+
+    @staticmethod
+    def _best(buckets: Optional[dict], line: dict, now: datetime, best: Optional[dict], best_amount: float):
+        if buckets is None:
+            return best, best_amount
+        for group in (buckets["percent_off"], *buckets["buy_x_get_y"].values()):
+            for rule in group:
+                if is_live(rule, now):
+                    amount = line_discount(rule, line)
+                    if amount > best_amount:
+                        best, best_amount = rule, amount
+                    break
+        return best, best_amount
+
+    def evaluate(self, lines: List[dict], coupon_code: Optional[str] = None, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.utcnow()
+        subtotal = 0.0
+        line_total = 0.0
+        applied = []
+        for line in lines:
+            subtotal += line["price"] * line["quantity"]
+            best, best_amount = self._best(self.by_product.get(line["product_id"]), line, now, None, 0.0)
+            best, best_amount = self._best(self.by_category.get(line.get("category")), line, now, best, best_amount)
+            if best is not None:
+                line_total += best_amount
+                applied.append({
+                    "promotion_id": best["id"],
+                    "name": best.get("name"),
+                    "product_id": line["product_id"],
+                    "amount": round(best_amount, 2),
+                })
+
+        discount = line_total
+        if coupon_code:
+            rule = self.coupons.get(coupon_code.strip().upper())
+            if rule is None or not is_live(rule, now):
+                raise PromotionError("Invalid or expired coupon code")
+            base = subtotal - line_total
+            if base < rule.get("min_cart_total", 0):
+                raise PromotionError(f"Coupon requires a minimum order of {rule['min_cart_total']}")
+            if rule.get("percent_off"):
+                amount = base * rule["percent_off"] / 100
+                if rule.get("max_discount"):
+                    amount = min(amount, rule["max_discount"])
+            else:
+                amount = min(rule.get("amount_off", 0), base)
+            discount += amount
+            applied.append({"promotion_id": rule["id"], "name": rule.get("name"), "code": rule["code"], "amount": round(amount, 2)})
+
+        return {
+            "subtotal": round(subtotal, 2),
+            "discount_total": round(discount, 2),
+            "total": round(subtotal - discount, 2),
+            "applied": applied,
+        }
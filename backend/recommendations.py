@@ -0,0 +1,86 @@
+"""
+"Frequently bought together" recommendations from order history.
+Co-occurrence counts live in a sparse {product: {other_product: count}} map. A full build
+reads every order once with pandas; afterwards new orders are folded in incrementally and
+only the products they touch have their top-K neighbours recomputed.
+"""
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class CooccurrenceModel:
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.orders_with: Dict[str, int] = {}
+        self.neighbours: Dict[str, List[dict]] = {}
+
+    @classmethod
+    def from_orders(cls, orders: Iterable[dict], top_k: int = 10) -> "CooccurrenceModel":
+        model = cls(top_k)
+        rows = [
+            (order["id"], item["product_id"])
+            for order in orders
+            for item in order.get("items") or []
+        ]
+        if not rows:
+            return model
+        lines = pd.DataFrame(rows, columns=["order_id", "product_id"]).drop_duplicates()
+        model.orders_with = lines["product_id"].value_counts().to_dict()
+        # Self-join on order id gives every ordered pair of distinct products per order
+        pairs = lines.merge(lines, on="order_id")
+        pairs = pairs[pairs["product_id_x"] != pairs["product_id_y"]]
+        grouped = pairs.groupby(["product_id_x", "product_id_y"]).size()
+        for (product, other), count in grouped.items():
+            model.counts.setdefault(product, {})[other] = int(count)
+        model._rank(model.counts.keys())
+        return model
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], top_k: int = 10) -> "CooccurrenceModel":
+        """Rebuild a (possibly partial) model from stored per-product rows."""
+        model = cls(top_k)
+        for row in rows:
+            model.counts[row["product_id"]] = dict(row.get("counts") or {})
+            model.orders_with[row["product_id"]] = row.get("orders_with", 0)
+        return model
+
+    def row(self, product_id: str) -> dict:
+        return {
+            "product_id": product_id,
+            "orders_with": self.orders_with.get(product_id, 0),
+            "counts": self.counts.get(product_id, {}),
+            "related": self.neighbours.get(product_id, []),
+        }
+
+    def add_order(self, order: dict):
+        products = list({item["product_id"] for item in order.get("items") or []})
+        for product in products:
+            self.orders_with[product] = self.orders_with.get(product, 0) + 1
+            row = self.counts.setdefault(product, {})
+            for other in products:
+                if other != product:
+                    row[other] = row.get(other, 0) + 1
+        self._rank(products)
+
+    def _rank(self, products: Iterable[str]):
+        for product in list(products):
+            row = self.counts.get(product)
+            if not row:
+                self.neighbours.pop(product, None)
+                continue
+            others = list(row.keys())
+            counts = np.fromiter(row.values(), dtype=np.int64, count=len(others))
+            k = min(self.top_k, len(others))
+            top = np.argpartition(-counts, k - 1)[:k]
+            top = top[np.argsort(-counts[top], kind="stable")]
+            total = self.orders_with.get(product, 1)
+            self.neighbours[product] = [
+                {"product_id": others[i], "count": int(counts[i]), "confidence": round(float(counts[i]) / total, 4)}
+                for i in top
+            ]
+
+    def ranked(self, products: Iterable[str]) -> List[dict]:
+        return [self.row(product) for product in products]
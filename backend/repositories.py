@@ -0,0 +1,633 @@
+"""
+Repositories for products, customers, orders, admins, auth sessions, idempotency keys and the
+admin audit log.
+Handlers talk to these instead of raw collections. The Mongo implementations issue the same
+queries the handlers used to; the in-memory ones keep documents in dicts keyed by id with
+secondary indexes (email, username, customer id, sorted search prefixes), so the API can run
+in-process without a database. Every repository exposes the same methods, which lets
+caching or metrics wrappers sit in front of any of them uniformly.
+"""
+import copy
+import re
+import threading
+from bisect import bisect_left, insort
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+PRIVATE_CUSTOMER_FIELDS = ("password", "search_name_tokens", "search_email", "search_phone")
+CUSTOMER_SEARCH_FIELDS = ("search_name_tokens", "search_email", "search_phone")
+
+
+def projection(fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return {"_id": 0}
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+def pick(document: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return dict(document)
+    return {field: document[field] for field in fields if field in document}
+
+
+def newest_first(orders: List[dict]) -> List[dict]:
+    return sorted(orders, key=lambda order: order.get("created_at") or datetime.min, reverse=True)
+
+
+def written() -> Future:
+    future = Future()
+    future.set_result(None)
+    return future
+
+
+# Mongo implementations
+class MongoProductRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def get(self, product_id: str) -> Optional[dict]:
+        return self.database.products.find_one({"id": product_id}, {"_id": 0})
+
+    def get_many(self, product_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        fields = None if fields is None else ["id", *fields]
+        products = self.database.products.find({"id": {"$in": list(product_ids)}}, projection(fields))
+        return {product["id"]: product for product in products}
+
+    def list_all(self) -> List[dict]:
+        return list(self.database.products.find({}, {"_id": 0}))
+
+    def count(self) -> int:
+        return self.database.products.count_documents({})
+
+    def add(self, product: dict):
+        self.database.products.insert_one(product)
+        product.pop("_id", None)
+
+    def update(self, product_id: str, changes: dict) -> bool:
+        return self.database.products.update_one({"id": product_id}, {"$set": changes}).matched_count > 0
+
+    def delete(self, product_id: str) -> bool:
+        return self.database.products.delete_one({"id": product_id}).deleted_count > 0
+
+
+class MongoCustomerRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def get(self, customer_id: str) -> Optional[dict]:
+        return self.database.customers.find_one({"id": customer_id}, {"_id": 0})
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        return self.database.customers.find_one({"email": email}, {"_id": 0})
+
+    def get_many(self, customer_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        fields = None if fields is None else ["id", *fields]
+        customers = self.database.customers.find({"id": {"$in": list(customer_ids)}}, projection(fields))
+        return {customer["id"]: customer for customer in customers}
+
+    def list_public(self) -> List[dict]:
+        return list(self.database.customers.find({}, {"_id": 0, **{field: 0 for field in PRIVATE_CUSTOMER_FIELDS}}))
+
+    def count(self) -> int:
+        return self.database.customers.count_documents({})
+
+    def add(self, customer: dict):
+        self.database.customers.insert_one(customer)
+        customer.pop("_id", None)
+
+    def search(self, prefixes: Dict[str, str], limit: int) -> List[dict]:
+        """Customers whose search field starts with the given prefix, for any of `prefixes`."""
+        clauses = [{field: {"$regex": "^" + re.escape(prefix)}} for field, prefix in prefixes.items()]
+        hidden = {"_id": 0, **{field: 0 for field in PRIVATE_CUSTOMER_FIELDS}}
+        return list(self.database.customers.find({"$or": clauses}, hidden).limit(limit))
+
+
+class MongoOrderRepository:
+    def __init__(self, database, writer=None):
+        self.database = database
+        self.writer = writer
+
+    def add(self, order: dict):
+        if self.writer is not None:
+            self.writer.insert(order)
+        else:
+            self.database.orders.insert_one(order)
+        order.pop("_id", None)
+
+    def get(self, order_id: str, fields: Optional[List[str]] = None, include_archived: bool = False) -> Optional[dict]:
+        order = self.database.orders.find_one({"id": order_id}, projection(fields))
+        if order is None and include_archived:
+            order = self.database.orders_archive.find_one({"id": order_id}, projection(fields))
+        return order
+
+    def get_many(self, order_ids: List[str], fields: Optional[List[str]] = None) -> List[dict]:
+        return list(self.database.orders.find({"id": {"$in": list(order_ids)}}, projection(fields)))
+
+    def list(self, customer_id: Optional[str] = None, include_archived: bool = False) -> List[dict]:
+        query = {} if customer_id is None else {"customer_id": customer_id}
+        orders = list(self.database.orders.find(query, {"_id": 0}).sort("created_at", DESCENDING))
+        if include_archived:
+            orders.extend(self.database.orders_archive.find(query, {"_id": 0}))
+            orders = newest_first(orders)
+        return orders
+
+    def find_by_status(
+        self,
+        status: str,
+        limit: Optional[int] = None,
+        delivery_slot_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        hub_id: Optional[str] = None,
+    ) -> List[dict]:
+        """Oldest first, straight off the (status, created_at) or (hub_id, status, created_at) index."""
+        query = {"status": status}
+        if hub_id:
+            query["hub_id"] = hub_id
+        if delivery_slot_id:
+            query["delivery_slot.id"] = delivery_slot_id
+        cursor = self.database.orders.find(query, projection(fields) if fields else {"_id": 0, "status_history": 0})
+        cursor = cursor.sort("created_at", ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def count(self) -> int:
+        return self.database.orders.count_documents({}) + self.database.orders_archive.estimated_document_count()
+
+    def count_by_customer(self, customer_ids: List[str]) -> Dict[str, int]:
+        counts = dict.fromkeys(customer_ids, 0)
+        pipeline = [
+            {"$match": {"customer_id": {"$in": customer_ids}}},
+            {"$group": {"_id": "$customer_id", "count": {"$sum": 1}}},
+        ]
+        for collection in (self.database.orders, self.database.orders_archive):
+            for row in collection.aggregate(pipeline):
+                counts[row["_id"]] = counts.get(row["_id"], 0) + row["count"]
+        return counts
+
+    def transition(self, moves: List[dict], entry: dict) -> List[str]:
+        """Apply a status_history `entry` to each {id, status} still in that status; returns moved ids.
+
+        One unordered bulk_write; the entry's transition id then identifies exactly the orders
+        this call moved, even when other writers raced it.
+        """
+        if not moves:
+            return []
+        update = {"$set": {"status": entry["status"], "status_updated_at": entry["at"]}, "$push": {"status_history": entry}}
+        self.database.orders.bulk_write(
+            [UpdateOne({"id": move["id"], "status": move["status"]}, update) for move in moves],
+            ordered=False
+        )
+        moved = self.database.orders.find(
+            {"id": {"$in": [move["id"] for move in moves]}, "status_history.transition_id": entry["transition_id"]},
+            {"_id": 0, "id": 1}
+        )
+        return [order["id"] for order in moved]
+
+
+class MongoAdminRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return self.database.admins.find_one({"username": username}, {"_id": 0})
+
+    def add(self, admin: dict):
+        self.database.admins.insert_one(admin)
+        admin.pop("_id", None)
+
+
+class MongoRefreshTokenRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def add(self, token: dict):
+        self.database.refresh_tokens.insert_one(token)
+        token.pop("_id", None)
+
+    def get(self, token_hash: str) -> Optional[dict]:
+        return self.database.refresh_tokens.find_one({"token_hash": token_hash}, {"_id": 0})
+
+    def rotate(self, token_hash: str, rotated_at: datetime) -> Optional[dict]:
+        """Mark a not-yet-rotated token as rotated; returns it as it was, or None."""
+        return self.database.refresh_tokens.find_one_and_update(
+            {"token_hash": token_hash, "rotated_at": None},
+            {"$set": {"rotated_at": rotated_at}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+
+    def delete_session(self, session_id: str):
+        self.database.refresh_tokens.delete_many({"session_id": session_id})
+
+    def delete_user(self, user_id: str):
+        self.database.refresh_tokens.delete_many({"user_id": user_id})
+
+
+class MongoRevocationRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def add(self, entry: dict):
+        self.database.revoked_tokens.insert_one(entry)
+        entry.pop("_id", None)
+
+    def created_since(self, since: Optional[datetime]) -> List[dict]:
+        query = {} if since is None else {"created_at": {"$gte": since}}
+        return list(self.database.revoked_tokens.find(query, {"_id": 0}))
+
+
+class MongoIdempotencyRepository:
+    def __init__(self, database):
+        self.database = database
+
+    def claim(self, entry: dict):
+        """Insert the in-flight placeholder; raises DuplicateKeyError if the key is taken."""
+        self.database.idempotency_keys.insert_one(entry)
+        entry.pop("_id", None)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.database.idempotency_keys.find_one({"key": key}, {"_id": 0})
+
+    def take_over(self, key: str, lease_id: Optional[str], new_lease_id: str, lease_expires_at: datetime) -> bool:
+        """Move an unanswered placeholder still held by `lease_id` to `new_lease_id`."""
+        result = self.database.idempotency_keys.update_one(
+            {"key": key, "response": None, "lease_id": lease_id},
+            {"$set": {"lease_id": new_lease_id, "lease_expires_at": lease_expires_at}}
+        )
+        return result.modified_count > 0
+
+    def release(self, key: str, lease_id: str):
+        self.database.idempotency_keys.delete_one({"key": key, "response": None, "lease_id": lease_id})
+
+    def complete(self, key: str, lease_id: str, response: dict):
+        self.database.idempotency_keys.update_one({"key": key, "lease_id": lease_id}, {"$set": {"response": response}})
+
+
+class MongoAuditRepository:
+    def __init__(self, database, writer=None):
+        self.database = database
+        self.writer = writer
+
+    def add(self, entry: dict) -> Future:
+        """Queue `entry` on the writer; the future resolves once it is stored."""
+        if self.writer is not None:
+            return self.writer.submit(entry)
+        self.database.admin_audit.insert_one(entry)
+        entry.pop("_id", None)
+        return written()
+
+    def recent(self, filters: Dict[str, str], skip: int, limit: int) -> List[dict]:
+        """Newest first; `filters` are exact matches on entity_id, admin_id or action."""
+        cursor = self.database.admin_audit.find(filters, {"_id": 0, "expires_at": 0})
+        return list(cursor.sort("at", DESCENDING).skip(skip).limit(limit))
+
+
+# In-memory implementations
+class PrefixIndex:
+    """Sorted (key, id) pairs; a prefix lookup is a bisect plus a scan over the matches."""
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, keys, document_id: str):
+        for key in keys if isinstance(keys, list) else [keys]:
+            if key:
+                insort(self.entries, (key, document_id))
+
+    def matches(self, prefix: str):
+        position = bisect_left(self.entries, (prefix, ""))
+        while position < len(self.entries) and self.entries[position][0].startswith(prefix):
+            yield self.entries[position][1]
+            position += 1
+
+
+class InMemoryProductRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, product_id: str) -> Optional[dict]:
+        product = self.by_id.get(product_id)
+        return dict(product) if product else None
+
+    def get_many(self, product_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        fields = None if fields is None else ["id", *fields]
+        return {
+            product_id: pick(self.by_id[product_id], fields)
+            for product_id in product_ids if product_id in self.by_id
+        }
+
+    def list_all(self) -> List[dict]:
+        return [dict(product) for product in self.by_id.values()]
+
+    def count(self) -> int:
+        return len(self.by_id)
+
+    def add(self, product: dict):
+        with self._lock:
+            if product["id"] in self.by_id:
+                raise DuplicateKeyError(f"Duplicate product id {product['id']}")
+            self.by_id[product["id"]] = copy.deepcopy(product)
+
+    def update(self, product_id: str, changes: dict) -> bool:
+        with self._lock:
+            if product_id not in self.by_id:
+                return False
+            self.by_id[product_id] = {**self.by_id[product_id], **copy.deepcopy(changes)}
+            return True
+
+    def delete(self, product_id: str) -> bool:
+        with self._lock:
+            return self.by_id.pop(product_id, None) is not None
+
+
+class InMemoryCustomerRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_email: Dict[str, str] = {}
+        self.search_indexes = {field: PrefixIndex() for field in CUSTOMER_SEARCH_FIELDS}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def public(customer: dict) -> dict:
+        return {key: value for key, value in customer.items() if key not in PRIVATE_CUSTOMER_FIELDS}
+
+    def get(self, customer_id: str) -> Optional[dict]:
+        customer = self.by_id.get(customer_id)
+        return dict(customer) if customer else None
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        return self.get(self.by_email.get(email))
+
+    def get_many(self, customer_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        fields = None if fields is None else ["id", *fields]
+        return {
+            customer_id: pick(self.by_id[customer_id], fields)
+            for customer_id in customer_ids if customer_id in self.by_id
+        }
+
+    def list_public(self) -> List[dict]:
+        return [self.public(customer) for customer in self.by_id.values()]
+
+    def count(self) -> int:
+        return len(self.by_id)
+
+    def add(self, customer: dict):
+        with self._lock:
+            if customer["id"] in self.by_id:
+                raise DuplicateKeyError(f"Duplicate customer id {customer['id']}")
+            self.by_id[customer["id"]] = copy.deepcopy(customer)
+            self.by_email[customer["email"]] = customer["id"]
+            for field, index in self.search_indexes.items():
+                index.add(customer.get(field), customer["id"])
+
+    def search(self, prefixes: Dict[str, str], limit: int) -> List[dict]:
+        found = []
+        for field, prefix in prefixes.items():
+            for customer_id in self.search_indexes[field].matches(prefix):
+                if customer_id not in found:
+                    found.append(customer_id)
+                    if len(found) >= limit:
+                        return [self.public(self.by_id[customer_id]) for customer_id in found]
+        return [self.public(self.by_id[customer_id]) for customer_id in found]
+
+
+class InMemoryOrderRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_customer: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, order: dict):
+        with self._lock:
+            if order["id"] in self.by_id:
+                raise DuplicateKeyError(f"Duplicate order id {order['id']}")
+            self.by_id[order["id"]] = copy.deepcopy(order)
+            self.by_customer.setdefault(order["customer_id"], []).append(order["id"])
+
+    def get(self, order_id: str, fields: Optional[List[str]] = None, include_archived: bool = False) -> Optional[dict]:
+        order = self.by_id.get(order_id)
+        return pick(order, fields) if order else None
+
+    def get_many(self, order_ids: List[str], fields: Optional[List[str]] = None) -> List[dict]:
+        return [pick(self.by_id[order_id], fields) for order_id in order_ids if order_id in self.by_id]
+
+    def list(self, customer_id: Optional[str] = None, include_archived: bool = False) -> List[dict]:
+        if customer_id is None:
+            orders = self.by_id.values()
+        else:
+            orders = (self.by_id[order_id] for order_id in self.by_customer.get(customer_id, []))
+        return newest_first([dict(order) for order in orders])
+
+    def find_by_status(
+        self,
+        status: str,
+        limit: Optional[int] = None,
+        delivery_slot_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        hub_id: Optional[str] = None,
+    ) -> List[dict]:
+        orders = [
+            order for order in self.by_id.values()
+            if order["status"] == status
+            and (not hub_id or order.get("hub_id") == hub_id)
+            and (not delivery_slot_id or (order.get("delivery_slot") or {}).get("id") == delivery_slot_id)
+        ]
+        orders.sort(key=lambda order: order.get("created_at") or datetime.min)
+        if fields is None:
+            orders = [{key: value for key, value in order.items() if key != "status_history"} for order in orders]
+        else:
+            orders = [pick(order, fields) for order in orders]
+        return orders[:limit] if limit else orders
+
+    def count(self) -> int:
+        return len(self.by_id)
+
+    def count_by_customer(self, customer_ids: List[str]) -> Dict[str, int]:
+        return {customer_id: len(self.by_customer.get(customer_id, [])) for customer_id in customer_ids}
+
+    def transition(self, moves: List[dict], entry: dict) -> List[str]:
+        moved = []
+        with self._lock:
+            for move in moves:
+                order = self.by_id.get(move["id"])
+                if order is not None and order["status"] == move["status"]:
+                    # Replace rather than append so previously returned copies stay unchanged
+                    self.by_id[move["id"]] = {
+                        **order,
+                        "status": entry["status"],
+                        "status_updated_at": entry["at"],
+                        "status_history": order.get("status_history", []) + [dict(entry)],
+                    }
+                    moved.append(move["id"])
+        return moved
+
+
+class InMemoryAdminRepository:
+    def __init__(self):
+        self.by_username: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        admin = self.by_username.get(username)
+        return dict(admin) if admin else None
+
+    def add(self, admin: dict):
+        with self._lock:
+            if admin["username"] in self.by_username:
+                raise DuplicateKeyError(f"Duplicate admin {admin['username']}")
+            self.by_username[admin["username"]] = copy.deepcopy(admin)
+
+
+class InMemoryRefreshTokenRepository:
+    """Refresh tokens by hash; expired ones are left for the handlers' expiry check, like the TTL lag."""
+
+    def __init__(self):
+        self.by_hash: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, token: dict):
+        with self._lock:
+            if token["token_hash"] in self.by_hash:
+                raise DuplicateKeyError("Duplicate refresh token")
+            self.by_hash[token["token_hash"]] = dict(token)
+
+    def get(self, token_hash: str) -> Optional[dict]:
+        token = self.by_hash.get(token_hash)
+        return dict(token) if token else None
+
+    def rotate(self, token_hash: str, rotated_at: datetime) -> Optional[dict]:
+        with self._lock:
+            token = self.by_hash.get(token_hash)
+            if token is None or token["rotated_at"] is not None:
+                return None
+            self.by_hash[token_hash] = {**token, "rotated_at": rotated_at}
+            return dict(token)
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            for token_hash in [h for h, token in self.by_hash.items() if token["session_id"] == session_id]:
+                del self.by_hash[token_hash]
+
+    def delete_user(self, user_id: str):
+        with self._lock:
+            for token_hash in [h for h, token in self.by_hash.items() if token["user_id"] == user_id]:
+                del self.by_hash[token_hash]
+
+
+class InMemoryRevocationRepository:
+    def __init__(self):
+        self.entries: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self._lock:
+            now = datetime.utcnow()
+            self.entries = [existing for existing in self.entries if existing["expires_at"] > now]
+            self.entries.append(dict(entry))
+
+    def created_since(self, since: Optional[datetime]) -> List[dict]:
+        return [dict(entry) for entry in self.entries if since is None or entry["created_at"] >= since]
+
+
+class InMemoryIdempotencyRepository:
+    def __init__(self):
+        self.by_key: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, entry: dict):
+        with self._lock:
+            if entry["key"] in self.by_key:
+                raise DuplicateKeyError(f"Duplicate idempotency key {entry['key']}")
+            self.by_key[entry["key"]] = dict(entry)
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.by_key.get(key)
+        return dict(entry) if entry else None
+
+    def take_over(self, key: str, lease_id: Optional[str], new_lease_id: str, lease_expires_at: datetime) -> bool:
+        with self._lock:
+            entry = self.by_key.get(key)
+            if entry is None or entry["response"] is not None or entry.get("lease_id") != lease_id:
+                return False
+            self.by_key[key] = {**entry, "lease_id": new_lease_id, "lease_expires_at": lease_expires_at}
+            return True
+
+    def release(self, key: str, lease_id: str):
+        with self._lock:
+            entry = self.by_key.get(key)
+            if entry is not None and entry["response"] is None and entry.get("lease_id") == lease_id:
+                del self.by_key[key]
+
+    def complete(self, key: str, lease_id: str, response: dict):
+        with self._lock:
+            entry = self.by_key.get(key)
+            if entry is not None and entry.get("lease_id") == lease_id:
+                self.by_key[key] = {**entry, "response": response}
+
+
+class InMemoryAuditRepository:
+    def __init__(self):
+        self.entries: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> Future:
+        with self._lock:
+            insort(self.entries, copy.deepcopy(entry), key=lambda stored: stored["at"])
+        return written()
+
+    def recent(self, filters: Dict[str, str], skip: int, limit: int) -> List[dict]:
+        matching = (
+            entry for entry in reversed(self.entries)
+            if all(entry.get(field) == value for field, value in filters.items())
+        )
+        page = []
+        for position, entry in enumerate(matching):
+            if position >= skip + limit:
+                break
+            if position >= skip:
+                page.append({key: value for key, value in entry.items() if key != "expires_at"})
+        return page
+
+
+class Repositories:
+    def __init__(self, products, customers, orders, admins, refresh_tokens, revoked_tokens, idempotency_keys, audit):
+        self.products = products
+        self.customers = customers
+        self.orders = orders
+        self.admins = admins
+        self.refresh_tokens = refresh_tokens
+        self.revoked_tokens = revoked_tokens
+        self.idempotency_keys = idempotency_keys
+        self.audit = audit
+
+    @classmethod
+    def mongo(cls, database, order_writer=None, audit_writer=None) -> "Repositories":
+        return cls(
+            MongoProductRepository(database),
+            MongoCustomerRepository(database),
+            MongoOrderRepository(database, order_writer),
+            MongoAdminRepository(database),
+            MongoRefreshTokenRepository(database),
+            MongoRevocationRepository(database),
+            MongoIdempotencyRepository(database),
+            MongoAuditRepository(database, audit_writer),
+        )
+
+    @classmethod
+    def in_memory(cls) -> "Repositories":
+        return cls(
+            InMemoryProductRepository(),
+            InMemoryCustomerRepository(),
+            InMemoryOrderRepository(),
+            InMemoryAdminRepository(),
+            InMemoryRefreshTokenRepository(),
+            InMemoryRevocationRepository(),
+            InMemoryIdempotencyRepository(),
+            InMemoryAuditRepository(),
+        )
@@ -1,20 +1,183 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 from bson import ObjectId
 import os
+import math
+import re
+import time
+import logging
 import jwt
 import bcrypt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
 import uuid
+import hashlib
+import secrets
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
 import base64
 
+from dispatch import haversine_km, plan_batches
+from group_commit import GroupCommitWriter
+from invoices import InvoiceStore, invoice_key, invoice_payload
+from promotions import PROMOTION_TYPES, PromotionEngine, PromotionError
+from repositories import Repositories
+from serviceability import ZoneIndex
+from structured_logging import CommandTimer, DebugSampler, configure_logging, elapsed_ms, start_request
+
+PROCESS_STARTED_AT = time.perf_counter()
+logger = logging.getLogger("meat_delivery")
+access_logger = logging.getLogger("meat_delivery.access")
+
+# Structured logging: JSON lines written by a background thread (configured per worker at
+# startup). Debug lines are kept for LOG_DEBUG_SAMPLE_RATE of requests, overridable per path
+# prefix with LOG_DEBUG_SAMPLE_RATES="/api/customer/orders=1,/api/products=0.01".
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0))
+LOG_DEBUG_SAMPLE_RATES = os.environ.get('LOG_DEBUG_SAMPLE_RATES', '')
+LOG_SLOW_COMMAND_MS = float(os.environ.get('LOG_SLOW_COMMAND_MS', 100))
+REQUEST_ID_PATTERN = re.compile(r"[\w.-]{1,64}")
+
+debug_sampler = DebugSampler.from_spec(LOG_DEBUG_SAMPLE_RATES, LOG_DEBUG_SAMPLE_RATE)
+command_timer = CommandTimer(LOG_SLOW_COMMAND_MS, logging.getLogger("meat_delivery.mongo"))
+log_pipeline = {"listener": None, "handler": None}
+
 # Initialize FastAPI app
 app = FastAPI()
 
+# Admission control: route classes ordered by priority, highest first
+ADMISSION_SHED_INFLIGHT = int(os.environ.get('ADMISSION_SHED_INFLIGHT', 64))
+ADMISSION_ROUTE_CLASSES = {
+    "checkout": {"priority": 3, "max_inflight": int(os.environ.get('ADMISSION_CHECKOUT_INFLIGHT', 64)), "latency_target_ms": 500, "retry_after": 1},
+    "auth": {"priority": 2, "max_inflight": int(os.environ.get('ADMISSION_AUTH_INFLIGHT', 32)), "latency_target_ms": 1000, "retry_after": 2},
+    "catalog": {"priority": 1, "max_inflight": int(os.environ.get('ADMISSION_CATALOG_INFLIGHT', 128)), "latency_target_ms": 200, "retry_after": 2},
+    "admin": {"priority": 0, "max_inflight": int(os.environ.get('ADMISSION_ADMIN_INFLIGHT', 16)), "latency_target_ms": 1000, "retry_after": 5},
+}
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if path.startswith("/api/health") or method == "OPTIONS":
+        return None
+    if (path.startswith("/api/customer/orders") and method == "POST") or path.startswith("/api/customer/cart"):
+        return "checkout"
+    if path.startswith("/api/admin/") and not path.startswith("/api/admin/login"):
+        return "admin"
+    if path.startswith(("/api/products", "/api/delivery-slots", "/api/serviceability")):
+        return "catalog"
+    return "auth"
+
+class AdmissionController:
+    """Tracks in-flight requests and an EWMA of latency per route class.
+
+    A class is rejected once it reaches its own in-flight ceiling. Under pressure (too many
+    requests in flight overall, or a higher-priority class running over its latency target)
+    lower-priority classes are shed so checkout keeps its latency budget. Latency samples older
+    than `stale_after` seconds are ignored so a shed class is readmitted once things recover.
+    """
+
+    def __init__(self, route_classes: dict, shed_inflight: int, alpha: float = 0.2, stale_after: float = 5.0):
+        self.route_classes = route_classes
+        self.shed_inflight = shed_inflight
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.inflight = {name: 0 for name in route_classes}
+        self.latency_ms = {name: 0.0 for name in route_classes}
+        self.sampled_at = {name: 0.0 for name in route_classes}
+        self.shed_count = {name: 0 for name in route_classes}
+        self._lock = threading.Lock()
+
+    def _over_target(self, name: str, now: float) -> bool:
+        if now - self.sampled_at[name] > self.stale_after:
+            return False
+        return self.latency_ms[name] > self.route_classes[name]["latency_target_ms"]
+
+    def _under_pressure(self, priority: int, now: float) -> bool:
+        if sum(self.inflight.values()) >= self.shed_inflight:
+            return True
+        return any(
+            config["priority"] > priority and self._over_target(name, now)
+            for name, config in self.route_classes.items()
+        )
+
+    def try_acquire(self, name: str) -> bool:
+        config = self.route_classes[name]
+        now = time.monotonic()
+        with self._lock:
+            if self.inflight[name] >= config["max_inflight"]:
+                self.shed_count[name] += 1
+                return False
+            if config["priority"] < self.route_classes["checkout"]["priority"] and self._under_pressure(config["priority"], now):
+                self.shed_count[name] += 1
+                return False
+            self.inflight[name] += 1
+            return True
+
+    def release(self, name: str, elapsed_ms: float):
+        with self._lock:
+            self.inflight[name] -= 1
+            now = time.monotonic()
+            if now - self.sampled_at[name] > self.stale_after:
+                self.latency_ms[name] = elapsed_ms
+            else:
+                self.latency_ms[name] += self.alpha * (elapsed_ms - self.latency_ms[name])
+            self.sampled_at[name] = now
+
+admission = AdmissionController(ADMISSION_ROUTE_CLASSES, ADMISSION_SHED_INFLIGHT)
+
+# Registered before CORS so CORS stays outermost and shed responses still carry its headers
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    name = route_class(request.method, request.url.path)
+    if name is None:
+        return await call_next(request)
+    if not admission.try_acquire(name):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Service is busy, please retry shortly"},
+            headers={"Retry-After": str(ADMISSION_ROUTE_CLASSES[name]["retry_after"])}
+        )
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(name, (time.perf_counter() - started) * 1000)
+
+# Outside admission control so shed requests are logged with their request id too
+@app.middleware("http")
+async def request_logging(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID")
+    if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    path = request.url.path
+    stats = start_request(request_id, f"{request.method} {path}", debug_sampler.sample(path))
+    started = time.perf_counter()
+    fields = {"method": request.method, "path": path}
+    try:
+        response = await call_next(request)
+    except Exception:
+        access_logger.exception("request failed", extra={**fields, "duration_ms": elapsed_ms(started)})
+        raise
+    response.headers["X-Request-ID"] = request_id
+    # Probes hit every few seconds; keep them out of the default log level
+    level = logging.DEBUG if path.startswith("/api/health") else logging.INFO
+    access_logger.log(level, "%s %s %s", request.method, path, response.status_code, extra={
+        **fields,
+        "status": response.status_code,
+        "duration_ms": elapsed_ms(started),
+        "mongo_commands": stats["commands"],
+        "mongo_ms": round(stats["ms"], 2)
+    })
+    return response
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -29,14 +192,130 @@ MONGO_URL = os.environ.get('MONGO_URL')
 if not MONGO_URL:
     raise RuntimeError("Missing MONGO_URL environment variable")
 
-client = MongoClient(MONGO_URL)
+MONGO_DB_NAME = "meat_delivery"
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 4))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_client() -> MongoClient:
+    """Return this process's MongoClient, creating it on first use.
+
+    A MongoClient must not be carried across fork(), so a worker forked from a parent that
+    already created one gets a fresh client of its own.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(
+                    MONGO_URL,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    event_listeners=[command_timer],
+                    connect=False
+                )
+                _client_pid = pid
+    return _client
+
+class LazyDatabase:
+    """Resolves `db.<collection>` against the current process's client on each access."""
+
+    def __init__(self, name: str, read_preference=None):
+        self._name = name
+        self._read_preference = read_preference
+
+    def _database(self):
+        return get_client().get_database(self._name, read_preference=self._read_preference)
+
+    def __getattr__(self, item):
+        return getattr(self._database(), item)
 
-db = client.meat_delivery
+    def __getitem__(self, item):
+        return self._database()[item]
+
+# Read routing. Checkout, auth, the catalog cache (whose prices checkout compares against) and
+# every write go through `db` on the primary. Hub stock levels, dashboard counts and admin
+# listings go through `reporting_db`, which may be served by a secondary no more than MONGO_MAX_STALENESS_SECONDS behind. To exercise this
+# locally, start `mongod --replSet rs0`, run `rs.initiate()` once and point MONGO_URL at
+# mongodb://localhost:27017/?replicaSet=rs0; against a standalone server every read preference
+# falls back to the single node.
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+MONGO_REPORTING_READ_PREFERENCE = os.environ.get('MONGO_REPORTING_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', 90))
+
+def reporting_read_preference():
+    mode = READ_PREFERENCE_MODES.get(MONGO_REPORTING_READ_PREFERENCE)
+    if mode is None:
+        raise RuntimeError(f"Unknown MONGO_REPORTING_READ_PREFERENCE: {MONGO_REPORTING_READ_PREFERENCE}")
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+
+db = LazyDatabase(MONGO_DB_NAME)
+reporting_db = LazyDatabase(MONGO_DB_NAME, read_preference=reporting_read_preference())
+
+# Group commit: with ORDER_GROUP_COMMIT on, concurrent checkouts in a worker share one
+# insert_many per ORDER_GROUP_COMMIT_DELAY_MS window instead of a round trip each
+ORDER_GROUP_COMMIT = os.environ.get('ORDER_GROUP_COMMIT', 'false') == 'true'
+ORDER_GROUP_COMMIT_DELAY_MS = float(os.environ.get('ORDER_GROUP_COMMIT_DELAY_MS', 5))
+ORDER_GROUP_COMMIT_MAX_BATCH = int(os.environ.get('ORDER_GROUP_COMMIT_MAX_BATCH', 100))
+
+order_writer = GroupCommitWriter(
+    lambda: db.orders,
+    max_batch=ORDER_GROUP_COMMIT_MAX_BATCH,
+    max_delay=ORDER_GROUP_COMMIT_DELAY_MS / 1000
+)
+
+AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', 1))
+AUDIT_FLUSH_BATCH = int(os.environ.get('AUDIT_FLUSH_BATCH', 500))
+
+audit_writer = GroupCommitWriter(
+    lambda: db.admin_audit,
+    max_batch=AUDIT_FLUSH_BATCH,
+    max_delay=AUDIT_FLUSH_SECONDS
+)
+
+# Products, customers, orders, admins, auth sessions, idempotency keys and the audit log are
+# reached through repositories, one set per read preference. STORAGE_BACKEND=memory keeps those
+# in-process, so the catalog, accounts, order placement and order admin run offline for tests
+# and benchmarks. Carts, delivery slots, zones, hubs, promotions and forecasts still live only
+# in Mongo; their routes answer 503 in memory mode (see `requires_mongo`).
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+if STORAGE_BACKEND == "memory":
+    repositories = reporting_repositories = Repositories.in_memory()
+elif STORAGE_BACKEND == "mongo":
+    repositories = Repositories.mongo(db, order_writer if ORDER_GROUP_COMMIT else None, audit_writer)
+    reporting_repositories = Repositories.mongo(reporting_db)
+else:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+def requires_mongo():
+    if STORAGE_BACKEND != "mongo":
+        raise HTTPException(status_code=503, detail=f"Not available with STORAGE_BACKEND={STORAGE_BACKEND}")
 
 # JWT configuration
 JWT_SECRET = "your_secret_key_here_change_in_production"
 JWT_ALGORITHM = "HS256"
+# Access tokens are short-lived; clients renew them with a rotating refresh token
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', 15))
+REFRESH_TOKEN_DAYS = int(os.environ.get('REFRESH_TOKEN_DAYS', 30))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+# A just-rotated refresh token is still honoured this long, so concurrent renewals from two tabs
+# are not mistaken for a stolen token
+REFRESH_REUSE_GRACE_SECONDS = float(os.environ.get('REFRESH_REUSE_GRACE_SECONDS', 10))
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Pydantic models
 class AdminLogin(BaseModel):
@@ -53,6 +332,9 @@ class CustomerLogin(BaseModel):
     email: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class Product(BaseModel):
     id: Optional[str] = None
     name: str
@@ -65,79 +347,1204 @@ class Product(BaseModel):
     origin: Optional[str] = None
     storage: Optional[str] = None
 
+# Only what the customer chooses: product details are snapshotted from the catalog at order
+# time (so history renders without it), never taken from the request
 class OrderItem(BaseModel):
     product_id: str
     quantity: int
     price: float
 
+class DeliveryLocation(BaseModel):
+    lat: float
+    lng: float
+
 class Order(BaseModel):
     id: Optional[str] = None
     customer_id: Optional[str] = None
     items: List[OrderItem]
-    total_amount: float
+    total_amount: float  # as shown to the customer; the stored total is priced from the catalog
     status: str = "pending"
     created_at: Optional[datetime] = None
+    delivery_slot_id: Optional[str] = None
+    delivery_location: Optional[DeliveryLocation] = None
+    coupon_code: Optional[str] = None
+
+# Token revocation: revoked sessions and per-user cut-offs are written to the
+# TTL-indexed `revoked_tokens` collection and mirrored into in-memory maps, so verify_token
+# checks them in O(1). Each worker pulls new entries at most every REVOCATION_SYNC_SECONDS.
+class RevocationList:
+    def __init__(self, sync_seconds: float):
+        self.sync_seconds = sync_seconds
+        self.sessions = {}  # session id -> expires_at
+        self.users = {}  # user id -> (revoked_before epoch milliseconds, expires_at)
+        self._synced_at = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _apply(self, entry: dict):
+        kind, value, expires_at = entry["kind"], entry["value"], entry["expires_at"]
+        if kind == "session":
+            self.sessions[value] = expires_at
+        elif kind == "user":
+            revoked_before = max(entry.get("revoked_before_ms", 0), self.users.get(value, (0, None))[0])
+            self.users[value] = (revoked_before, expires_at)
+
+    def _prune(self, now: datetime):
+        for value in [v for v, expires_at in self.sessions.items() if expires_at <= now]:
+            del self.sessions[value]
+        for value in [v for v, (_, expires_at) in self.users.items() if expires_at <= now]:
+            del self.users[value]
+
+    def sync(self):
+        synced_at = datetime.utcnow()
+        since = None if self._synced_at is None else self._synced_at - timedelta(seconds=2)
+        entries = repositories.revoked_tokens.created_since(since)
+        with self._lock:
+            for entry in entries:
+                self._apply(entry)
+            self._prune(synced_at)
+            self._synced_at = synced_at
+        self._checked_at = time.monotonic()
+
+    def is_revoked(self, payload: dict) -> bool:
+        if time.monotonic() - self._checked_at > self.sync_seconds:
+            self._checked_at = time.monotonic()
+            self.sync()
+        if payload["sid"] in self.sessions:
+            return True
+        cutoff = self.users.get(payload.get("user_id"))
+        # `iat` is whole seconds, so a login in the same second as a logout-all would look older
+        # than the cut-off; compare the millisecond issue time instead
+        return cutoff is not None and payload.get("iat_ms", payload.get("iat", 0) * 1000) < cutoff[0]
+
+    def revoke(self, kind: str, value: str, **extra):
+        now = datetime.utcnow()
+        # Access tokens never outlive ACCESS_TOKEN_MINUTES, so neither does their revocation
+        entry = {
+            "kind": kind,
+            "value": value,
+            "created_at": now,
+            "expires_at": now + timedelta(minutes=ACCESS_TOKEN_MINUTES, seconds=60),
+            **extra
+        }
+        repositories.revoked_tokens.add(dict(entry))
+        with self._lock:
+            self._apply(entry)
+
+revocations = RevocationList(REVOCATION_SYNC_SECONDS)
 
 # JWT token functions
-def create_access_token(data: dict):
+def create_access_token(data: dict, session_id: Optional[str] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=24)
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    to_encode.update({
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_MINUTES),
+        "iat": now,
+        "iat_ms": int(time.time() * 1000),
+        "jti": uuid.uuid4().hex,
+        "sid": session_id or uuid.uuid4().hex
+    })
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+def issue_tokens(user_id: str, role: str, session_id: Optional[str] = None) -> dict:
+    """Access token plus an opaque refresh token; only the refresh token's hash is stored."""
+    session_id = session_id or uuid.uuid4().hex
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    repositories.refresh_tokens.add({
+        "token_hash": hash_refresh_token(refresh_token),
+        "session_id": session_id,
+        "user_id": user_id,
+        "role": role,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_DAYS),
+        "rotated_at": None
+    })
+    return {
+        "access_token": create_access_token({"user_id": user_id, "role": role}, session_id),
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_MINUTES * 60
+    }
+
+def revoke_session(session_id: str):
+    repositories.refresh_tokens.delete_session(session_id)
+    revocations.revoke("session", session_id)
+
+def revoke_user_sessions(user_id: str):
+    repositories.refresh_tokens.delete_user(user_id)
+    revocations.revoke("user", user_id, revoked_before_ms=int(time.time() * 1000))
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # Tokens minted before sessions existed cannot be revoked, so they are no longer accepted
+    if "sid" not in payload:
+        raise HTTPException(status_code=401, detail="Token expired")
+    if revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
 
 # Initialize admin user
 def init_admin():
-    admin_collection = db.admins
-    existing_admin = admin_collection.find_one({"username": "shiv"})
+    existing_admin = repositories.admins.get_by_username("shiv")
     if not existing_admin:
         hashed_password = bcrypt.hashpw("123".encode('utf-8'), bcrypt.gensalt())
-        admin_collection.insert_one({
-            "id": str(uuid.uuid4()),
-            "username": "shiv",
-            "password": hashed_password,
-            "created_at": datetime.utcnow()
+        try:
+            repositories.admins.add({
+                "id": str(uuid.uuid4()),
+                "username": "shiv",
+                "password": hashed_password,
+                "created_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            # Another worker bootstrapped concurrently
+            pass
+
+# Idempotency keys for order placement
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+# An in-flight placeholder older than this is presumed orphaned (worker killed mid-request) and a
+# retry may take it over; keep it well above the slowest order placement
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 60))
+
+class RecentKeyCache:
+    """Small LRU of recently completed idempotent responses, checked before MongoDB."""
+
+    def __init__(self, maxsize: int, ttl_seconds: int):
+        self.maxsize = maxsize
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["created_at"] + self.ttl < datetime.utcnow():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+idempotency_cache = RecentKeyCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+# Login and registration throttling
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo'
+# Number of reverse proxies in front of the app that append to X-Forwarded-For. The header is
+# ignored unless this is set: every entry left of the trusted hops is client-controlled.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+
+class TokenBucketLimiter:
+    """Token buckets keyed by client IP or account, refilled continuously at `rate` tokens/second.
+
+    The in-process buckets are always consulted first so a burst is rejected without any
+    database work. With RATE_LIMIT_BACKEND=mongo, requests that pass locally are also charged
+    against a shared bucket in the `rate_limits` collection so limits hold across workers.
+    """
+
+    def __init__(self, name: str, capacity: int, per_seconds: int, max_keys: int = 100000):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _retry_after(self, tokens: float) -> int:
+        return max(1, math.ceil((1 - tokens) / self.rate))
+
+    def _take_local(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False, self._retry_after(tokens)
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return True, 0
+
+    def _prune(self, now: float):
+        # Buckets that would have refilled completely carry no state worth keeping
+        full_after = self.capacity / self.rate
+        for key in [k for k, (_, last) in self._buckets.items() if now - last >= full_after]:
+            del self._buckets[key]
+
+    def _take_shared(self, key: str):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [self.capacity, {"$add": [{"$ifNull": ["$tokens", self.capacity]}, {"$multiply": [elapsed, self.rate]}]}]}
+        bucket = db.rate_limits.find_one_and_update(
+            {"key": f"{self.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]}
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return True, 0
+        return False, self._retry_after(bucket["tokens"])
+
+    def check(self, key: str):
+        allowed, retry_after = self._take_local(key)
+        if allowed and RATE_LIMIT_SHARED:
+            allowed, retry_after = self._take_shared(key)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please try again later",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+login_ip_limiter = TokenBucketLimiter("login_ip", capacity=int(os.environ.get('LOGIN_IP_BURST', 20)), per_seconds=60)
+login_account_limiter = TokenBucketLimiter("login_account", capacity=int(os.environ.get('LOGIN_ACCOUNT_BURST', 5)), per_seconds=300)
+register_ip_limiter = TokenBucketLimiter("register_ip", capacity=int(os.environ.get('REGISTER_IP_BURST', 10)), per_seconds=600)
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and RATE_LIMIT_TRUSTED_PROXIES > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            # The outermost trusted proxy appended the address it saw the request come from
+            return hops[-min(RATE_LIMIT_TRUSTED_PROXIES, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+def init_indexes():
+    db.admins.create_index([("username", ASCENDING)], unique=True)
+    db.idempotency_keys.create_index([("key", ASCENDING)], unique=True)
+    db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    db.rate_limits.create_index([("key", ASCENDING)], unique=True)
+    db.rate_limits.create_index("updated_at", expireAfterSeconds=3600)
+    db.orders.create_index([("id", ASCENDING)], unique=True)
+    db.orders.create_index([("customer_id", ASCENDING), ("created_at", DESCENDING)])
+    db.orders.create_index([("created_at", DESCENDING)])
+    db.customers.create_index([("id", ASCENDING)], unique=True)
+    db.customers.create_index([("search_name_tokens", ASCENDING)])
+    db.customers.create_index([("search_email", ASCENDING)])
+    db.customers.create_index([("search_phone", ASCENDING)])
+    db.products.create_index([("id", ASCENDING)], unique=True)
+    db.orders.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    db.orders.create_index([("hub_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)])
+    db.orders_archive.create_index([("id", ASCENDING)], unique=True)
+    db.orders_archive.create_index([("customer_id", ASCENDING), ("created_at", DESCENDING)])
+    db.orders_archive.create_index([("created_at", DESCENDING)])
+    db.carts.create_index([("customer_id", ASCENDING)], unique=True)
+    db.carts.create_index("updated_at", expireAfterSeconds=CART_TTL_DAYS * 24 * 3600)
+    db.delivery_slots.create_index([("id", ASCENDING)], unique=True)
+    db.delivery_slots.create_index([("date", ASCENDING)])
+    db.delivery_slots.create_index([("updated_at", ASCENDING)])
+    db.delivery_zones.create_index([("id", ASCENDING)], unique=True)
+    db.product_cooccurrence.create_index([("product_id", ASCENDING)], unique=True)
+    db.promotions.create_index([("id", ASCENDING)], unique=True)
+    db.admin_audit.create_index([("at", DESCENDING)])
+    db.admin_audit.create_index([("entity_id", ASCENDING), ("at", DESCENDING)])
+    db.admin_audit.create_index([("admin_id", ASCENDING), ("at", DESCENDING)])
+    db.admin_audit.create_index("expires_at", expireAfterSeconds=0)
+    db.refresh_tokens.create_index([("token_hash", ASCENDING)], unique=True)
+    db.refresh_tokens.create_index([("session_id", ASCENDING)])
+    db.refresh_tokens.create_index([("user_id", ASCENDING)])
+    db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    db.revoked_tokens.create_index([("created_at", ASCENDING)])
+    db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+    db.hubs.create_index([("id", ASCENDING)], unique=True)
+    db.inventory.create_index([("hub_id", ASCENDING), ("product_id", ASCENDING)], unique=True)
+
+def product_snapshot(product: dict) -> dict:
+    image = product.get("image") or ""
+    return {
+        "name": product.get("name"),
+        "category": product.get("category"),
+        "weight": product.get("weight"),
+        # Inline base64 images are too large to copy into every order line
+        "thumbnail": image if image.startswith(("http://", "https://")) else None,
+    }
+
+def snapshot_order_items(items: List[dict]) -> List[dict]:
+    """Order lines priced and described from the catalog; a price the customer did not see is sent back."""
+    if any(item["quantity"] < 1 for item in items):
+        raise HTTPException(status_code=400, detail="Quantities must be at least 1")
+    product_ids = list({item["product_id"] for item in items})
+    products = repositories.products.get_many(product_ids, ["name", "category", "weight", "image", "price"])
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if missing:
+        raise HTTPException(status_code=400, detail={"message": "Unknown products", "product_ids": missing})
+    issues = [
+        {"product_id": item["product_id"], "issue": "price_changed", "old_price": item["price"], "new_price": products[item["product_id"]]["price"]}
+        for item in items
+        if item["price"] != products[item["product_id"]]["price"]
+    ]
+    if issues:
+        raise HTTPException(status_code=409, detail={"message": "Prices changed, please review", "issues": issues})
+    return [
+        {"product_id": item["product_id"], "quantity": item["quantity"], "price": products[item["product_id"]]["price"], **product_snapshot(products[item["product_id"]])}
+        for item in items
+    ]
+
+# Server-side carts: one compact document per customer, revalidated against the catalog with a
+# single batched lookup on every update so checkout only has to convert it into an order
+CART_TTL_DAYS = int(os.environ.get('CART_TTL_DAYS', 7))
+CART_REVALIDATE_SECONDS = int(os.environ.get('CART_REVALIDATE_SECONDS', 60))
+
+def empty_cart(customer_id: str) -> dict:
+    return {
+        "customer_id": customer_id,
+        "items": [],
+        "total_amount": 0.0,
+        "issues": [],
+        "version": 0,
+        "hub_id": None,
+        "validated_at": None
+    }
+
+def load_cart(customer_id: str) -> dict:
+    return db.carts.find_one({"customer_id": customer_id}, {"_id": 0}) or empty_cart(customer_id)
+
+def cart_total(items: List[dict]) -> float:
+    return round(sum(item["price"] * item["quantity"] for item in items), 2)
+
+def cart_hub(location: Optional[DeliveryLocation]) -> Optional[dict]:
+    """The hub checkout would ship the cart from, or None while that cannot be told yet."""
+    try:
+        return select_hub(location)
+    except HTTPException:
+        return None
+
+def revalidate_cart(cart: dict, hub: Optional[dict] = None) -> dict:
+    """Re-price the cart and check it against stock: the hub's once hubs exist, else the catalog's.
+
+    With hubs configured but no `hub` known yet, stock is left to checkout's reservation.
+    """
+    product_ids = [item["product_id"] for item in cart["items"]]
+    products = repositories.products.get_many(
+        product_ids, ["name", "category", "weight", "image", "price", "stock"]
+    )
+    if hub is not None:
+        stock = hub_stock(hub["id"], product_ids)
+    elif not hub_directory.current():
+        stock = {product_id: product["stock"] for product_id, product in products.items()}
+    else:
+        stock = None
+    items, issues = [], []
+    for item in cart["items"]:
+        product = products.get(item["product_id"])
+        if not product:
+            issues.append({"product_id": item["product_id"], "issue": "unavailable"})
+            continue
+        quantity = item["quantity"]
+        if stock is not None:
+            available = stock.get(item["product_id"], 0)
+            if available <= 0:
+                issues.append({"product_id": item["product_id"], "issue": "out_of_stock"})
+                continue
+            if quantity > available:
+                issues.append({"product_id": item["product_id"], "issue": "quantity_reduced", "available": available})
+                quantity = available
+        if item.get("price") is not None and item["price"] != product["price"]:
+            issues.append({"product_id": item["product_id"], "issue": "price_changed", "old_price": item["price"], "new_price": product["price"]})
+        items.append({
+            "product_id": item["product_id"],
+            "quantity": quantity,
+            "price": product["price"],
+            **product_snapshot(product)
         })
+    cart["items"] = items
+    cart["issues"] = issues
+    cart["total_amount"] = cart_total(items)
+    cart["hub_id"] = hub["id"] if hub else None
+    cart["validated_at"] = datetime.utcnow()
+    return cart
+
+def cart_is_fresh(cart: dict, hub: Optional[dict] = None) -> bool:
+    validated_at = cart.get("validated_at")
+    return (
+        validated_at is not None
+        and cart.get("hub_id") == (hub["id"] if hub else None)
+        and datetime.utcnow() - validated_at < timedelta(seconds=CART_REVALIDATE_SECONDS)
+    )
+
+def save_cart(cart: dict) -> dict:
+    # Optimistic concurrency: a concurrent writer bumps the version first, so our upsert
+    # misses the filter and collides with the unique customer_id index
+    version = cart["version"]
+    cart["version"] = version + 1
+    cart["updated_at"] = datetime.utcnow()
+    try:
+        db.carts.replace_one({"customer_id": cart["customer_id"], "version": version}, cart, upsert=True)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
+    return cart
+
+# Delivery slots. Every day has the same DELIVERY_SLOT_WINDOWS, created on demand with
+# DELIVERY_SLOT_CAPACITY. Reservations are a conditional $inc on the slot document, and the
+# availability each worker serves comes from an in-memory copy that only re-reads slots whose
+# updated_at moved since its last sync.
+DELIVERY_SLOT_WINDOWS = [
+    tuple(window.strip().split("-"))
+    for window in os.environ.get('DELIVERY_SLOT_WINDOWS', '07:00-10:00,10:00-13:00,17:00-20:00,20:00-22:00').split(",")
+]
+DELIVERY_SLOT_CAPACITY = int(os.environ.get('DELIVERY_SLOT_CAPACITY', 40))
+DELIVERY_SLOT_DAYS = int(os.environ.get('DELIVERY_SLOT_DAYS', 7))
+DELIVERY_SLOT_CUTOFF_MINUTES = int(os.environ.get('DELIVERY_SLOT_CUTOFF_MINUTES', 60))
+DELIVERY_SLOT_SYNC_SECONDS = float(os.environ.get('DELIVERY_SLOT_SYNC_SECONDS', 5))
+DELIVERY_TIMEZONE = ZoneInfo(os.environ.get('DELIVERY_TIMEZONE', 'Asia/Kolkata'))
+
+def local_now() -> datetime:
+    return datetime.now(DELIVERY_TIMEZONE)
+
+def slot_starts_at(slot: dict) -> datetime:
+    return datetime.strptime(f"{slot['date']} {slot['start']}", "%Y-%m-%d %H:%M").replace(tzinfo=DELIVERY_TIMEZONE)
+
+def ensure_delivery_slots(first_day: date, days: int):
+    now = datetime.utcnow()
+    operations = []
+    for offset in range(days):
+        day = (first_day + timedelta(days=offset)).isoformat()
+        for start, end in DELIVERY_SLOT_WINDOWS:
+            slot_id = f"{day}_{start}-{end}"
+            operations.append(UpdateOne(
+                {"id": slot_id},
+                {"$setOnInsert": {
+                    "id": slot_id,
+                    "date": day,
+                    "start": start,
+                    "end": end,
+                    "capacity": DELIVERY_SLOT_CAPACITY,
+                    "reserved": 0,
+                    "updated_at": now
+                }},
+                upsert=True
+            ))
+    db.delivery_slots.bulk_write(operations, ordered=False)
+
+class SlotAvailabilityCache:
+    """Per-worker copy of upcoming delivery slots.
+
+    Rebuilt from scratch once per local day, and otherwise kept current by re-reading only the
+    slots updated since the last sync (with a small overlap for clock skew between workers).
+    Reservations made by this worker are applied immediately from the update result.
+    """
+
+    def __init__(self, sync_seconds: float):
+        self.sync_seconds = sync_seconds
+        self._slots = {}
+        self._day = None
+        self._synced_at = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _rebuild(self, today: date):
+        ensure_delivery_slots(today, DELIVERY_SLOT_DAYS)
+        synced_at = datetime.utcnow()
+        slots = db.delivery_slots.find({"date": {"$gte": today.isoformat()}}, {"_id": 0})
+        with self._lock:
+            self._slots = {slot["id"]: slot for slot in slots}
+            self._day = today
+            self._synced_at = synced_at
+
+    def _sync(self):
+        synced_at = datetime.utcnow()
+        changed = db.delivery_slots.find({"updated_at": {"$gte": self._synced_at - timedelta(seconds=2)}}, {"_id": 0})
+        with self._lock:
+            for slot in changed:
+                if slot["date"] >= self._day.isoformat():
+                    self._slots[slot["id"]] = slot
+            self._synced_at = synced_at
 
-# Initialize admin on startup
+    def refresh_if_due(self):
+        today = local_now().date()
+        if self._day != today:
+            self._rebuild(today)
+            self._checked_at = time.monotonic()
+        elif time.monotonic() - self._checked_at > self.sync_seconds:
+            self._sync()
+            self._checked_at = time.monotonic()
+
+    def apply(self, slot: dict):
+        with self._lock:
+            self._slots[slot["id"]] = slot
+
+    def get(self, slot_id: str) -> Optional[dict]:
+        self.refresh_if_due()
+        return self._slots.get(slot_id)
+
+    def available(self, days: int) -> list:
+        self.refresh_if_due()
+        bookable_from = local_now() + timedelta(minutes=DELIVERY_SLOT_CUTOFF_MINUTES)
+        last_day = (self._day + timedelta(days=days - 1)).isoformat()
+        return [
+            {
+                "id": slot["id"],
+                "date": slot["date"],
+                "start": slot["start"],
+                "end": slot["end"],
+                "capacity": slot["capacity"],
+                "available": max(0, slot["capacity"] - slot["reserved"])
+            }
+            for slot in sorted(self._slots.values(), key=lambda s: (s["date"], s["start"]))
+            if slot["date"] <= last_day and slot_starts_at(slot) > bookable_from
+        ]
+
+slot_cache = SlotAvailabilityCache(DELIVERY_SLOT_SYNC_SECONDS)
+
+def reserve_delivery_slot(slot_id: str) -> dict:
+    requires_mongo()
+    slot = slot_cache.get(slot_id)
+    if not slot:
+        raise HTTPException(status_code=400, detail="Unknown delivery slot")
+    if slot_starts_at(slot) <= local_now() + timedelta(minutes=DELIVERY_SLOT_CUTOFF_MINUTES):
+        raise HTTPException(status_code=400, detail="Delivery slot is no longer bookable")
+    slot = db.delivery_slots.find_one_and_update(
+        {"id": slot_id, "$expr": {"$lt": ["$reserved", "$capacity"]}},
+        {"$inc": {"reserved": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not slot:
+        raise HTTPException(status_code=409, detail="Delivery slot is full")
+    slot_cache.apply(slot)
+    return slot
+
+def release_delivery_slot(slot_id: str):
+    slot = db.delivery_slots.find_one_and_update(
+        {"id": slot_id, "reserved": {"$gt": 0}},
+        {"$inc": {"reserved": -1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if slot:
+        slot_cache.apply(slot)
+
+class VersionedCache:
+    """A per-worker copy of a collection, rebuilt whenever its version in `meta` moves.
+
+    Writers call `changed()` after a write; readers call `refresh_if_due()`, which compares the
+    version at most every `sync_seconds`. Subclasses set `meta_id` and implement `load()`.
+    """
+
+    meta_id: str = None
+
+    def __init__(self, sync_seconds: float):
+        self.sync_seconds = sync_seconds
+        self.version = None
+        self._checked_at = 0.0
+
+    def load(self):
+        raise NotImplementedError
+
+    def reload(self):
+        meta = db.meta.find_one({"_id": self.meta_id}) or {}
+        self.load()
+        self.version = meta.get("version", 0)
+        self._checked_at = time.monotonic()
+
+    def refresh_if_due(self):
+        # These collections only exist in Mongo; offline they stay empty
+        if STORAGE_BACKEND == "memory":
+            return
+        if time.monotonic() - self._checked_at > self.sync_seconds:
+            self._checked_at = time.monotonic()
+            meta = db.meta.find_one({"_id": self.meta_id}, {"version": 1}) or {}
+            if meta.get("version", 0) != self.version:
+                self.reload()
+
+    def changed(self):
+        db.meta.update_one({"_id": self.meta_id}, {"$inc": {"version": 1}}, upsert=True)
+        self.reload()
+
+# Delivery zones are served from an in-memory ZoneIndex. Every zone write bumps a version
+# in `meta`; workers compare it at most every ZONE_SYNC_SECONDS and rebuild when it moved.
+ZONE_SYNC_SECONDS = float(os.environ.get('ZONE_SYNC_SECONDS', 10))
+
+class ServiceabilityCache(VersionedCache):
+    meta_id = "delivery_zones"
+
+    def __init__(self, sync_seconds: float):
+        super().__init__(sync_seconds)
+        self.index = ZoneIndex([])
+
+    def load(self):
+        self.index = ZoneIndex(list(db.delivery_zones.find({}, {"_id": 0})))
+
+    def current(self) -> ZoneIndex:
+        self.refresh_if_due()
+        return self.index
+
+serviceability_cache = ServiceabilityCache(ZONE_SYNC_SECONDS)
+
+def delivery_zones_changed():
+    serviceability_cache.changed()
+
+# Fulfilment hubs. Each hub serves a set of delivery zones and keeps its own stock in
+# `inventory`, one document per (hub_id, product_id), so checkouts in one city never contend
+# with another city's documents. Active hubs are mirrored per worker and re-read when the hubs
+# version in `meta` moves. With no hubs configured, orders are placed without a stock
+# reservation, as before.
+HUB_SYNC_SECONDS = float(os.environ.get('HUB_SYNC_SECONDS', 10))
+HUB_MAX_DISTANCE_KM = float(os.environ.get('HUB_MAX_DISTANCE_KM', 25))
+DEFAULT_HUB_ID = os.environ.get('DEFAULT_HUB_ID')
+
+class HubDirectory(VersionedCache):
+    meta_id = "hubs"
+
+    def __init__(self, sync_seconds: float):
+        super().__init__(sync_seconds)
+        self.hubs = {}
+        self.by_zone = {}
+
+    def load(self):
+        hubs = list(db.hubs.find({"active": True}, {"_id": 0}))
+        by_zone = {}
+        for hub in hubs:
+            for zone_id in hub.get("zone_ids") or []:
+                by_zone.setdefault(zone_id, hub)
+        self.hubs = {hub["id"]: hub for hub in hubs}
+        self.by_zone = by_zone
+
+    def current(self) -> dict:
+        self.refresh_if_due()
+        return self.hubs
+
+    def select(self, lat: float, lng: float) -> Optional[dict]:
+        """The hub serving the delivery zone at (lat, lng), else the nearest one in range."""
+        hubs = list(self.current().values())
+        if not hubs:
+            return None
+        for zone in serviceability_cache.current().lookup(lat=lat, lng=lng):
+            hub = self.by_zone.get(zone["id"])
+            if hub:
+                return hub
+        distances = haversine_km(
+            lat, lng,
+            [hub["location"]["lat"] for hub in hubs],
+            [hub["location"]["lng"] for hub in hubs]
+        )
+        nearest = int(distances.argmin())
+        return hubs[nearest] if distances[nearest] <= HUB_MAX_DISTANCE_KM else None
+
+hub_directory = HubDirectory(HUB_SYNC_SECONDS)
+
+def hubs_changed():
+    hub_directory.changed()
+
+def select_hub(location: Optional[DeliveryLocation]) -> Optional[dict]:
+    """The hub an order ships from; None while no hubs are configured.
+
+    Without a location the order ships from DEFAULT_HUB_ID, or from the only active hub.
+    """
+    hubs = hub_directory.current()
+    if not hubs:
+        return None
+    if location is None:
+        if DEFAULT_HUB_ID and DEFAULT_HUB_ID in hubs:
+            return hubs[DEFAULT_HUB_ID]
+        if len(hubs) == 1:
+            return next(iter(hubs.values()))
+        raise HTTPException(status_code=400, detail="Delivery location required")
+    hub = hub_directory.select(location.lat, location.lng)
+    if not hub:
+        raise HTTPException(status_code=400, detail="No hub delivers to this location yet")
+    return hub
+
+def hub_stock(hub_id: str, product_ids: List[str]) -> dict:
+    levels = db.inventory.find({"hub_id": hub_id, "product_id": {"$in": product_ids}}, {"_id": 0, "product_id": 1, "stock": 1})
+    return {level["product_id"]: level["stock"] for level in levels}
+
+def reserve_inventory(hub_id: str, items: List[dict]):
+    """Take the order's quantities off the hub's stock, all lines or none."""
+    quantities = {}
+    for item in items:
+        if item["quantity"] < 1:
+            raise HTTPException(status_code=400, detail="Quantities must be at least 1")
+        quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+    reserved = []
+    for product_id, quantity in quantities.items():
+        # Guarded $inc on a single document: no read-modify-write window for a concurrent checkout
+        result = db.inventory.update_one(
+            {"hub_id": hub_id, "product_id": product_id, "stock": {"$gte": quantity}},
+            {"$inc": {"stock": -quantity}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count == 0:
+            release_inventory(hub_id, reserved)
+            raise HTTPException(status_code=409, detail={"message": "Not enough stock", "product_id": product_id})
+        reserved.append({"product_id": product_id, "quantity": quantity})
+
+def release_inventory(hub_id: str, items: List[dict]):
+    if not items:
+        return
+    db.inventory.bulk_write([
+        UpdateOne(
+            {"hub_id": hub_id, "product_id": item["product_id"]},
+            {"$inc": {"stock": item["quantity"]}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        for item in items
+    ], ordered=False)
+
+# "Frequently bought together" neighbours are built offline by build_recommendations.py into
+# `product_cooccurrence`. Workers hold only the top-K lists in memory and reload them when
+# the job bumps the recommendations version in `meta`. The lists are read from the primary,
+# like the version, so a lagging secondary cannot hand back last run's rows under the new version.
+RECOMMENDATIONS_SYNC_SECONDS = float(os.environ.get('RECOMMENDATIONS_SYNC_SECONDS', 60))
+
+class RecommendationCache(VersionedCache):
+    meta_id = "recommendations"
+
+    def __init__(self, sync_seconds: float):
+        super().__init__(sync_seconds)
+        self.related = {}
+
+    def load(self):
+        rows = db.product_cooccurrence.find({}, {"_id": 0, "product_id": 1, "related": 1})
+        self.related = {row["product_id"]: row.get("related", []) for row in rows}
+
+    def get(self, product_id: str) -> list:
+        self.refresh_if_due()
+        return self.related.get(product_id, [])
+
+recommendation_cache = RecommendationCache(RECOMMENDATIONS_SYNC_SECONDS)
+
+# Promotions are compiled into a PromotionEngine per worker and recompiled whenever the
+# promotions version in `meta` moves, checked at most every PROMOTION_SYNC_SECONDS
+PROMOTION_SYNC_SECONDS = float(os.environ.get('PROMOTION_SYNC_SECONDS', 10))
+
+class PromotionCache(VersionedCache):
+    meta_id = "promotions"
+
+    def __init__(self, sync_seconds: float):
+        super().__init__(sync_seconds)
+        self.engine = PromotionEngine([])
+
+    def load(self):
+        self.engine = PromotionEngine(list(db.promotions.find({"active": True}, {"_id": 0})))
+
+    def current(self) -> PromotionEngine:
+        self.refresh_if_due()
+        return self.engine
+
+promotion_cache = PromotionCache(PROMOTION_SYNC_SECONDS)
+
+def promotions_changed():
+    promotion_cache.changed()
+
+# Hot/cold order tiering: delivered orders past ARCHIVE_AFTER_DAYS move to `orders_archive`
+# so `orders` only holds the working set. Reads stay on the hot tier unless asked otherwise.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+
+# Customer search matches anchored prefixes on lowercased name tokens, email and phone digits,
+# so every branch of the query is a range scan on its own index
+def normalize_search_text(value: str) -> str:
+    return " ".join((value or "").lower().split())
+
+def customer_search_fields(customer: dict) -> dict:
+    name = normalize_search_text(customer.get("name"))
+    words = name.split()
+    # Whole name too, so "john sm" matches as typed
+    tokens = list(dict.fromkeys(words + [name])) if name else []
+    digits = re.sub(r"\D", "", customer.get("phone") or "")
+    # With and without the country code, so either form of the number matches
+    phones = list(dict.fromkeys([digits, digits[-10:]])) if digits else []
+    return {
+        "search_name_tokens": tokens,
+        "search_email": normalize_search_text(customer.get("email")),
+        "search_phone": phones
+    }
+
+def search_customers(repos: Repositories, query: str, limit: int) -> list:
+    text = normalize_search_text(query)
+    prefixes = {"search_name_tokens": text, "search_email": text}
+    digits = re.sub(r"\D", "", text)
+    if len(digits) >= 3 and len(digits) * 2 >= len(text.replace(" ", "")):
+        prefixes["search_phone"] = digits
+    customers = repos.customers.search(prefixes, limit)
+    return sorted(customers, key=lambda customer: normalize_search_text(customer.get("name")))
+
+def archive_orders(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = 1000) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = {"status": "delivered", "created_at": {"$lt": cutoff}}
+    moved = 0
+    while True:
+        batch = list(db.orders.find(query).sort("created_at", ASCENDING).limit(batch_size))
+        if not batch:
+            break
+        # Copy before deleting so an interrupted run only ever leaves duplicates, which the
+        # unique index on orders_archive.id turns into ignorable errors on the next run
+        try:
+            db.orders_archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        db.orders.delete_many({"_id": {"$in": [order["_id"] for order in batch]}})
+        moved += len(batch)
+    return moved
+
+def replay_idempotent_response(entry: dict, request_hash: str, response: Response):
+    if entry.get("request_hash") != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if entry.get("response") is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    response.headers["Idempotent-Replayed"] = "true"
+    return entry["response"]
+
+def run_idempotent(customer_id: str, idempotency_key: Optional[str], request_hash: str, response: Response, action):
+    """Run `action` once per (customer, Idempotency-Key); replays get the stored response."""
+    if not idempotency_key:
+        return action()
+    
+    scoped_key = f"{customer_id}:{idempotency_key}"
+    cached = idempotency_cache.get(scoped_key)
+    if cached:
+        return replay_idempotent_response(cached, request_hash, response)
+    lease_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    # Never run `action` without holding the placeholder's lease, or its response is never stored
+    for _ in range(2):
+        try:
+            repositories.idempotency_keys.claim({
+                "key": scoped_key,
+                "request_hash": request_hash,
+                "response": None,
+                "lease_id": lease_id,
+                "lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+                "created_at": now
+            })
+            break
+        except DuplicateKeyError:
+            stored = repositories.idempotency_keys.get(scoped_key)
+            if not stored:
+                # Expired and reaped between the insert and the read: claim the key afresh
+                continue
+            if stored.get("response") is not None:
+                idempotency_cache.put(scoped_key, stored)
+            lease_expires_at = stored.get("lease_expires_at") or stored["created_at"] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            if stored.get("response") is not None or stored.get("request_hash") != request_hash or lease_expires_at > now:
+                return replay_idempotent_response(stored, request_hash, response)
+            # Take over the orphaned placeholder; the lease guard lets only one retry win
+            taken = repositories.idempotency_keys.take_over(
+                scoped_key, stored.get("lease_id"), lease_id, now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            )
+            if not taken:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+            break
+    else:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    
+    try:
+        result = action()
+    except Exception:
+        repositories.idempotency_keys.release(scoped_key, lease_id)
+        raise
+    
+    repositories.idempotency_keys.complete(scoped_key, lease_id, result)
+    idempotency_cache.put(scoped_key, {
+        "request_hash": request_hash,
+        "response": result,
+        "created_at": datetime.utcnow()
+    })
+    return result
+
+# Catalog cache
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', 30))
+
+class CatalogCache:
+    """In-process copy of the product catalog.
+
+    Admin writes invalidate it immediately in the worker that served them; other workers pick
+    the change up once their copy is older than the TTL. It is loaded from the primary, the
+    same copy checkout prices against, so a lagging secondary cannot re-cache an old price
+    straight after an invalidation.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self._products = None
+        self._by_id = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> list:
+        products = repositories.products.list_all()
+        with self._lock:
+            self._products = products
+            self._by_id = {p["id"]: p for p in products if "id" in p}
+            self._loaded_at = time.monotonic()
+        return products
+
+    def products(self) -> list:
+        if self._products is None or time.monotonic() - self._loaded_at > self.ttl:
+            return self.refresh()
+        return self._products
+
+    def get(self, product_id: str) -> Optional[dict]:
+        self.products()
+        return self._by_id.get(product_id)
+
+    def get_many(self, product_ids: List[str]) -> dict:
+        """Products by id from the warm cache; a cold cache costs one `$in` query, not a reload."""
+        if self._products is not None and time.monotonic() - self._loaded_at <= self.ttl:
+            by_id = self._by_id
+            return {product_id: by_id[product_id] for product_id in product_ids if product_id in by_id}
+        return repositories.products.get_many(product_ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._products = None
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL_SECONDS)
+
+# Hub storefronts: the shared catalog with each product's stock replaced by one hub's level.
+# Entries expire per hub, so each city's storefront only reads its own inventory documents.
+HUB_INVENTORY_TTL_SECONDS = float(os.environ.get('HUB_INVENTORY_TTL_SECONDS', 15))
+
+class HubCatalogCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, hub_id: str) -> list:
+        levels = reporting_db.inventory.find({"hub_id": hub_id}, {"_id": 0, "product_id": 1, "stock": 1})
+        stock = {level["product_id"]: level["stock"] for level in levels}
+        catalog = catalog_cache.products()
+        products = [{**product, "stock": stock.get(product.get("id"), 0)} for product in catalog]
+        with self._lock:
+            self._entries[hub_id] = (catalog, products, time.monotonic())
+        return products
+
+    def products(self, hub_id: str) -> list:
+        entry = self._entries.get(hub_id)
+        # Rebuilt when the hub's stock is older than the TTL or the shared catalog was reloaded
+        if entry is None or entry[0] is not catalog_cache.products() or time.monotonic() - entry[2] > self.ttl:
+            return self.refresh(hub_id)
+        return entry[1]
+
+    def invalidate(self, hub_id: Optional[str] = None):
+        with self._lock:
+            if hub_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(hub_id, None)
+
+hub_catalog_cache = HubCatalogCache(HUB_INVENTORY_TTL_SECONDS)
+
+# One-time bootstrapping, recorded in `meta` so each worker's startup only pays a lookup.
+# Bump BOOTSTRAP_VERSION whenever init_indexes or init_admin change.
+BOOTSTRAP_VERSION = 13
+BOOTSTRAP_ON_STARTUP = os.environ.get('BOOTSTRAP_ON_STARTUP', 'true') == 'true'
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 2000))
+
+def bootstrap(force: bool = False) -> bool:
+    if STORAGE_BACKEND == "memory":
+        # Nothing to index or record; the in-process repositories start empty in every worker
+        init_admin()
+        return True
+    if not force and db.meta.find_one({"_id": "bootstrap", "version": BOOTSTRAP_VERSION}):
+        return False
+    init_indexes()
+    init_admin()
+    db.meta.update_one(
+        {"_id": "bootstrap"},
+        {"$set": {"version": BOOTSTRAP_VERSION, "completed_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return True
+
+readiness = {"ready": False, "startup_ms": None}
+
+def warm_up():
+    if STORAGE_BACKEND == "mongo":
+        get_client().admin.command("ping")
+    if BOOTSTRAP_ON_STARTUP:
+        bootstrap()
+    catalog_cache.refresh()
+    if STORAGE_BACKEND == "mongo":
+        slot_cache.refresh_if_due()
+        serviceability_cache.reload()
+        hub_directory.reload()
+        recommendation_cache.reload()
+        promotion_cache.reload()
+    revocations.sync()
+    readiness["startup_ms"] = round((time.perf_counter() - PROCESS_STARTED_AT) * 1000, 1)
+    readiness["ready"] = True
+    if readiness["startup_ms"] > STARTUP_BUDGET_MS:
+        logger.warning("Startup took %.1fms, over the %.0fms budget", readiness["startup_ms"], STARTUP_BUDGET_MS)
+
+# Warm connections and caches before the worker reports ready
 @app.on_event("startup")
 def startup_event():
-    init_admin()
+    log_pipeline["listener"], log_pipeline["handler"] = configure_logging(LOG_LEVEL, LOG_QUEUE_SIZE)
+    try:
+        warm_up()
+    except PyMongoError:
+        logger.exception("Warm-up failed, readiness probe will retry")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush buffered audit entries and grouped order inserts before the worker exits
+    audit_writer.drain(SHUTDOWN_DRAIN_SECONDS)
+    order_writer.drain(SHUTDOWN_DRAIN_SECONDS)
+    invoice_prefetch.shutdown(wait=False, cancel_futures=True)
+    invoice_store.shutdown()
+    if log_pipeline["listener"] is not None:
+        if log_pipeline["handler"].dropped:
+            logger.warning("Dropped %d log lines while the log queue was full", log_pipeline["handler"].dropped)
+        log_pipeline["listener"].stop()
 
 # Routes
 @app.get("/api/health")
+@app.get("/api/health/live")
 async def health_check():
     return {"status": "healthy", "message": "Meat Delivery API is running"}
 
+@app.get("/api/health/ready")
+def readiness_check():
+    try:
+        if not readiness["ready"]:
+            warm_up()
+        if STORAGE_BACKEND == "mongo":
+            get_client().admin.command("ping")
+    except PyMongoError:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "message": "Database is not reachable"})
+    return {
+        "status": "ready",
+        "startup_ms": readiness["startup_ms"],
+        "startup_budget_ms": STARTUP_BUDGET_MS
+    }
+
+# Admin audit log. Entries are queued in memory and written in batches by `audit_writer`
+# (set up with the repositories), so auditing never adds a synchronous write to the admin
+# request itself.
+AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', 365))
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 5))
+# Large values are recorded as changed without copying them into the log
+AUDIT_REDACTED_FIELDS = ("image",)
+AUDIT_IGNORED_FIELDS = ("_id", "created_at", "updated_at")
+
+def audit_diff(before: Optional[dict], after: Optional[dict]) -> dict:
+    before, after = before or {}, after or {}
+    changes = {}
+    for field in sorted(set(before) | set(after)):
+        if field in AUDIT_IGNORED_FIELDS or before.get(field) == after.get(field):
+            continue
+        if field in AUDIT_REDACTED_FIELDS:
+            changes[field] = {
+                "before": "[redacted]" if before.get(field) else None,
+                "after": "[redacted]" if after.get(field) else None
+            }
+        else:
+            changes[field] = {"before": before.get(field), "after": after.get(field)}
+    return changes
+
+def log_audit_failure(future):
+    if future.exception() is not None:
+        logger.error("Failed to write admin audit entry: %s", future.exception())
+
+def record_audit(current_user: dict, action: str, entity: str, entity_id: str, before: Optional[dict], after: Optional[dict]):
+    now = datetime.utcnow()
+    entry = {
+        "id": str(uuid.uuid4()),
+        "at": now,
+        "expires_at": now + timedelta(days=AUDIT_RETENTION_DAYS),
+        "admin_id": current_user["user_id"],
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "changes": audit_diff(before, after)
+    }
+    repositories.audit.add(entry).add_done_callback(log_audit_failure)
+
 # Admin routes
 @app.post("/api/admin/login")
-async def admin_login(login_data: AdminLogin):
-    admin_collection = db.admins
-    admin = admin_collection.find_one({"username": login_data.username})
+async def admin_login(login_data: AdminLogin, request: Request):
+    login_ip_limiter.check(client_ip(request))
+    login_account_limiter.check(f"admin:{login_data.username.lower()}")
+    
+    admin = repositories.admins.get_by_username(login_data.username)
     
     if not admin or not bcrypt.checkpw(login_data.password.encode('utf-8'), admin["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"user_id": admin["id"], "role": "admin"})
-    return {"access_token": token, "token_type": "bearer", "role": "admin"}
+    return {**issue_tokens(admin["id"], "admin"), "role": "admin"}
+
+# Session routes
+@app.post("/api/auth/refresh")
+async def refresh_access_token(refresh_data: RefreshRequest):
+    token_hash = hash_refresh_token(refresh_data.refresh_token)
+    stored = repositories.refresh_tokens.rotate(token_hash, datetime.utcnow())
+    if not stored:
+        reused = repositories.refresh_tokens.get(token_hash)
+        if not reused:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        if datetime.utcnow() - reused["rotated_at"] > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            # A rotated refresh token coming back later means it leaked: end the whole session
+            revoke_session(reused["session_id"])
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        stored = reused
+    if stored["expires_at"] <= datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Refresh token expired")
+    return {**issue_tokens(stored["user_id"], stored["role"], stored["session_id"]), "role": stored["role"]}
+
+@app.post("/api/auth/logout")
+async def logout(
+    logout_data: Optional[RefreshRequest] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    # The refresh token still names the session after the access token has expired
+    if logout_data:
+        stored = repositories.refresh_tokens.get(hash_refresh_token(logout_data.refresh_token))
+        if stored:
+            revoke_session(stored["session_id"])
+        return {"message": "Logged out successfully"}
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    revoke_session(verify_token(credentials)["sid"])
+    return {"message": "Logged out successfully"}
+
+@app.post("/api/auth/logout-all")
+async def logout_all_sessions(current_user: dict = Depends(verify_token)):
+    revoke_user_sessions(current_user["user_id"])
+    return {"message": "All sessions revoked successfully"}
+
+@app.post("/api/admin/customers/{customer_id}/revoke-sessions")
+async def revoke_customer_sessions(customer_id: str, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    if not repositories.customers.get(customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    revoke_user_sessions(customer_id)
+    return {"message": "Customer sessions revoked successfully"}
 
 @app.get("/api/admin/dashboard")
 async def admin_dashboard(current_user: dict = Depends(verify_token)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    products_count = db.products.count_documents({})
-    orders_count = db.orders.count_documents({})
-    customers_count = db.customers.count_documents({})
+    products_count = reporting_repositories.products.count()
+    orders_count = reporting_repositories.orders.count()
+    customers_count = reporting_repositories.customers.count()
     
     return {
         "products_count": products_count,
@@ -154,7 +1561,9 @@ async def add_product(product: Product, current_user: dict = Depends(verify_toke
     product_dict["id"] = str(uuid.uuid4())
     product_dict["created_at"] = datetime.utcnow()
     
-    db.products.insert_one(product_dict)
+    repositories.products.add(product_dict)
+    catalog_cache.invalidate()
+    record_audit(current_user, "product.create", "product", product_dict["id"], None, product_dict)
     return {"message": "Product added successfully", "product_id": product_dict["id"]}
 
 @app.get("/api/admin/products")
@@ -162,7 +1571,7 @@ async def get_all_products_admin(current_user: dict = Depends(verify_token)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    products = list(db.products.find({}, {"_id": 0}))
+    products = repositories.products.list_all()
     return {"products": products}
 
 @app.put("/api/admin/products/{product_id}")
@@ -171,11 +1580,15 @@ async def update_product(product_id: str, product: Product, current_user: dict =
         raise HTTPException(status_code=403, detail="Admin access required")
     
     product_dict = product.dict()
+    # The path decides which product changes; a body id (usually null) must not overwrite it
+    product_dict.pop("id", None)
     product_dict["updated_at"] = datetime.utcnow()
     
-    result = db.products.update_one({"id": product_id}, {"$set": product_dict})
-    if result.matched_count == 0:
+    before = repositories.products.get(product_id)
+    if not before or not repositories.products.update(product_id, product_dict):
         raise HTTPException(status_code=404, detail="Product not found")
+    catalog_cache.invalidate()
+    record_audit(current_user, "product.update", "product", product_id, before, {**before, **product_dict})
     
     return {"message": "Product updated successfully"}
 
@@ -184,46 +1597,212 @@ async def delete_product(product_id: str, current_user: dict = Depends(verify_to
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    before = repositories.products.get(product_id)
+    if not before or not repositories.products.delete(product_id):
         raise HTTPException(status_code=404, detail="Product not found")
+    catalog_cache.invalidate()
+    record_audit(current_user, "product.delete", "product", product_id, before, None)
     
     return {"message": "Product deleted successfully"}
 
+@app.get("/api/admin/audit")
+async def get_audit_log(
+    page: int = 1,
+    page_size: int = 50,
+    entity_id: Optional[str] = None,
+    admin_id: Optional[str] = None,
+    action: Optional[str] = None,
+    current_user: dict = Depends(verify_token),
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    page, page_size = max(1, page), max(1, min(page_size, 100))
+    
+    filters = {}
+    if entity_id:
+        filters["entity_id"] = entity_id
+    if admin_id:
+        filters["admin_id"] = admin_id
+    if action:
+        filters["action"] = action
+    # One extra row tells whether another page exists without counting the collection
+    entries = reporting_repositories.audit.recent(filters, (page - 1) * page_size, page_size + 1)
+    return {
+        "entries": entries[:page_size],
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(entries) > page_size
+    }
+
 @app.get("/api/admin/orders")
-async def get_all_orders(current_user: dict = Depends(verify_token)):
+async def get_all_orders(include_archived: bool = False, current_user: dict = Depends(verify_token)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    orders = list(db.orders.find({}, {"_id": 0}))
+    orders = reporting_repositories.orders.list(include_archived=include_archived)
+    
+    # Get customer details for all orders in one query
+    customer_ids = list({order["customer_id"] for order in orders})
+    customers = reporting_repositories.customers.get_many(customer_ids, ["name", "email", "phone"])
+    for order in orders:
+        customer = customers.get(order["customer_id"])
+        order["customer"] = {k: v for k, v in customer.items() if k != "id"} if customer else None
     
-    # Get customer details for each order
+    return {"orders": orders}
+
+# Order status workflow. Each transition is a guarded update on the order's current status,
+# so concurrent edits cannot skip a step; cancelling releases the reserved delivery slot and
+# returns the items to the hub's stock.
+ORDER_TRANSITIONS = {
+    "pending": ("confirmed", "cancelled"),
+    "confirmed": ("packed", "cancelled"),
+    "packed": ("out_for_delivery", "cancelled"),
+    "out_for_delivery": ("delivered", "cancelled"),
+    "delivered": (),
+    "cancelled": (),
+}
+ORDER_BULK_TRANSITION_LIMIT = int(os.environ.get('ORDER_BULK_TRANSITION_LIMIT', 500))
+ORDER_TRANSITION_FIELDS = ["id", "status", "delivery_slot", "hub_id", "items"]
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+    note: Optional[str] = None
+
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[str]
+    status: str
+    note: Optional[str] = None
+
+def release_reservations(orders: List[dict]):
+    """Give back the slots and hub stock held by cancelled `orders`, one bulk_write for each."""
+    now = datetime.utcnow()
+    slots = Counter(order["delivery_slot"]["id"] for order in orders if order.get("delivery_slot"))
+    if slots:
+        db.delivery_slots.bulk_write([
+            UpdateOne({"id": slot_id, "reserved": {"$gte": count}}, {"$inc": {"reserved": -count}, "$set": {"updated_at": now}})
+            for slot_id, count in slots.items()
+        ], ordered=False)
+        for slot in db.delivery_slots.find({"id": {"$in": list(slots)}}, {"_id": 0}):
+            slot_cache.apply(slot)
+    stock = Counter()
+    for order in orders:
+        if order.get("hub_id"):
+            for item in order["items"]:
+                stock[(order["hub_id"], item["product_id"])] += item["quantity"]
+    if stock:
+        db.inventory.bulk_write([
+            UpdateOne({"hub_id": hub_id, "product_id": product_id}, {"$inc": {"stock": quantity}, "$set": {"updated_at": now}})
+            for (hub_id, product_id), quantity in stock.items()
+        ], ordered=False)
+
+def validate_order_status(target: str):
+    if target not in ORDER_TRANSITIONS:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(ORDER_TRANSITIONS)}")
+
+def transition_orders(orders: List[dict], target: str, admin_id: str, note: Optional[str] = None) -> dict:
+    """Move `orders` (id, status, delivery_slot, hub_id and items) to `target` with one unordered bulk_write."""
+    entry = {"status": target, "at": datetime.utcnow(), "by": admin_id, "transition_id": uuid.uuid4().hex}
+    if note:
+        entry["note"] = note
+    moves, rejected = [], []
     for order in orders:
-        customer = db.customers.find_one({"id": order["customer_id"]}, {"_id": 0, "name": 1, "email": 1, "phone": 1})
-        order["customer"] = customer
+        if target in ORDER_TRANSITIONS[order["status"]]:
+            moves.append({"id": order["id"], "status": order["status"]})
+        else:
+            rejected.append({"order_id": order["id"], "status": order["status"]})
+    moved_ids = set(repositories.orders.transition(moves, entry))
+    if target == "delivered" and moved_ids:
+        invoice_prefetch.submit(pregenerate_invoices, list(moved_ids))
+    if target == "cancelled":
+        release_reservations([order for order in orders if order["id"] in moved_ids])
+    conflicted = [
+        order["id"] for order in orders
+        if target in ORDER_TRANSITIONS[order["status"]] and order["id"] not in moved_ids
+    ]
+    return {
+        "updated_order_ids": [order["id"] for order in orders if order["id"] in moved_ids],
+        "rejected": rejected,
+        "conflicted_order_ids": conflicted
+    }
+
+@app.get("/api/admin/orders/queue")
+async def get_order_queue(status: str = "confirmed", limit: int = 50, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_order_status(status)
     
+    # Oldest first, straight off the (status, created_at) index: "next orders to pack"
+    orders = repositories.orders.find_by_status(status, limit=max(1, min(limit, 500)))
     return {"orders": orders}
 
+# Plain `def`: a transition makes blocking bulk writes, so it runs on the threadpool
+@app.put("/api/admin/orders/{order_id}/status")
+def update_order_status(order_id: str, update: OrderStatusUpdate, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_order_status(update.status)
+    
+    order = repositories.orders.get(order_id, ORDER_TRANSITION_FIELDS)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    result = transition_orders([order], update.status, current_user["user_id"], update.note)
+    if result["rejected"]:
+        raise HTTPException(status_code=400, detail=f"Cannot move order from {order['status']} to {update.status}")
+    if result["conflicted_order_ids"]:
+        raise HTTPException(status_code=409, detail="Order status changed concurrently, reload and retry")
+    return {"message": "Order status updated successfully", "status": update.status}
+
+@app.post("/api/admin/orders/status")
+def bulk_update_order_status(update: BulkOrderStatusUpdate, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_order_status(update.status)
+    order_ids = list(dict.fromkeys(update.order_ids))
+    if len(order_ids) > ORDER_BULK_TRANSITION_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {ORDER_BULK_TRANSITION_LIMIT} orders per request")
+    
+    orders = repositories.orders.get_many(order_ids, ORDER_TRANSITION_FIELDS)
+    found = {order["id"] for order in orders}
+    result = transition_orders(orders, update.status, current_user["user_id"], update.note)
+    result["missing_order_ids"] = [order_id for order_id in order_ids if order_id not in found]
+    return {"message": "Order statuses updated successfully", **result}
+
 @app.get("/api/admin/customers")
 async def get_all_customers(current_user: dict = Depends(verify_token)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     # Get all customers but exclude password field for security
-    customers = list(db.customers.find({}, {"_id": 0, "password": 0}))
+    customers = reporting_repositories.customers.list_public()
+    
+    # Add order count for each customer, across both order tiers
+    order_counts = reporting_repositories.orders.count_by_customer([customer["id"] for customer in customers])
+    for customer in customers:
+        customer["order_count"] = order_counts.get(customer["id"], 0)
+    
+    return {"customers": customers}
+
+@app.get("/api/admin/customers/search")
+async def search_customers_route(q: str, limit: int = 20, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if len(normalize_search_text(q)) < 2:
+        raise HTTPException(status_code=400, detail="Search needs at least 2 characters")
     
-    # Add order count for each customer
+    customers = search_customers(reporting_repositories, q, max(1, min(limit, 100)))
+    order_counts = reporting_repositories.orders.count_by_customer([customer["id"] for customer in customers])
     for customer in customers:
-        order_count = db.orders.count_documents({"customer_id": customer["id"]})
-        customer["order_count"] = order_count
+        customer["order_count"] = order_counts.get(customer["id"], 0)
     
     return {"customers": customers}
 
 # Customer routes
 @app.post("/api/customer/register")
-async def customer_register(customer_data: CustomerRegister):
+async def customer_register(customer_data: CustomerRegister, request: Request):
+    register_ip_limiter.check(client_ip(request))
+    
     # Check if customer already exists
-    existing_customer = db.customers.find_one({"email": customer_data.email})
+    existing_customer = repositories.customers.get_by_email(customer_data.email)
     if existing_customer:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -235,49 +1814,660 @@ async def customer_register(customer_data: CustomerRegister):
     customer_dict["id"] = str(uuid.uuid4())
     customer_dict["password"] = hashed_password
     customer_dict["created_at"] = datetime.utcnow()
+    customer_dict.update(customer_search_fields(customer_dict))
     
-    db.customers.insert_one(customer_dict)
+    repositories.customers.add(customer_dict)
     
-    token = create_access_token({"user_id": customer_dict["id"], "role": "customer"})
-    return {"access_token": token, "token_type": "bearer", "role": "customer", "message": "Registration successful"}
+    return {**issue_tokens(customer_dict["id"], "customer"), "role": "customer", "message": "Registration successful"}
 
 @app.post("/api/customer/login")
-async def customer_login(login_data: CustomerLogin):
-    customer = db.customers.find_one({"email": login_data.email})
+async def customer_login(login_data: CustomerLogin, request: Request):
+    login_ip_limiter.check(client_ip(request))
+    login_account_limiter.check(f"customer:{login_data.email.lower()}")
+    
+    customer = repositories.customers.get_by_email(login_data.email)
     
     if not customer or not bcrypt.checkpw(login_data.password.encode('utf-8'), customer["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"user_id": customer["id"], "role": "customer"})
-    return {"access_token": token, "token_type": "bearer", "role": "customer", "customer_name": customer["name"]}
+    return {**issue_tokens(customer["id"], "customer"), "role": "customer", "customer_name": customer["name"]}
 
 @app.get("/api/products")
-async def get_products():
-    products = list(db.products.find({}, {"_id": 0}))
-    return {"products": products}
+async def get_products(hub_id: Optional[str] = None, lat: Optional[float] = None, lng: Optional[float] = None):
+    # Storefronts that know the customer's hub, or location, get that hub's stock levels
+    if hub_id is None and lat is not None and lng is not None:
+        hub = hub_directory.select(lat, lng)
+        hub_id = hub["id"] if hub else None
+    if hub_id is None:
+        return {"products": catalog_cache.products()}
+    if hub_id not in hub_directory.current():
+        raise HTTPException(status_code=404, detail="Hub not found")
+    return {"products": hub_catalog_cache.products(hub_id), "hub_id": hub_id}
+
+PRODUCT_BATCH_LIMIT = int(os.environ.get('PRODUCT_BATCH_LIMIT', 100))
 
+class ProductBatchRequest(BaseModel):
+    ids: List[str]
+
+def product_batch(ids: List[str]) -> dict:
+    product_ids = list(dict.fromkeys(product_id for product_id in ids if product_id))
+    if len(product_ids) > PRODUCT_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {PRODUCT_BATCH_LIMIT} ids per request")
+    products = catalog_cache.get_many(product_ids)
+    return {
+        "products": [products[product_id] for product_id in product_ids if product_id in products],
+        "missing_ids": [product_id for product_id in product_ids if product_id not in products]
+    }
+
+@app.get("/api/products/batch")
+async def get_product_batch(ids: str = ""):
+    return product_batch([product_id.strip() for product_id in ids.split(",")])
+
+@app.post("/api/products/batch")
+async def post_product_batch(request: ProductBatchRequest):
+    return product_batch(request.ids)
+
+def insert_order(
+    customer_id: str,
+    items: List[dict],
+    delivery_slot_id: Optional[str] = None,
+    delivery_location: Optional[DeliveryLocation] = None,
+    coupon_code: Optional[str] = None,
+) -> dict:
+    # `items` carry catalog prices (snapshotted or revalidated), so the total is computed here
+    try:
+        pricing = promotion_cache.current().evaluate(items, coupon_code)
+    except PromotionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    hub = select_hub(delivery_location)
+    
+    order_dict = {
+        "id": str(uuid.uuid4()),
+        "customer_id": customer_id,
+        "items": items,
+        "total_amount": max(pricing["total"], 0),
+        "status": "pending",
+        "created_at": datetime.utcnow()
+    }
+    order_dict["status_history"] = [{"status": "pending", "at": order_dict["created_at"]}]
+    if pricing["applied"]:
+        order_dict["discounts"] = pricing["applied"]
+        order_dict["discount_total"] = pricing["discount_total"]
+    if delivery_location:
+        order_dict["delivery_location"] = delivery_location.dict()
+    if hub:
+        reserve_inventory(hub["id"], items)
+        order_dict["hub_id"] = hub["id"]
+    try:
+        if delivery_slot_id:
+            slot = reserve_delivery_slot(delivery_slot_id)
+            order_dict["delivery_slot"] = {key: slot[key] for key in ("id", "date", "start", "end")}
+        repositories.orders.add(order_dict)
+    except Exception:
+        if "delivery_slot" in order_dict:
+            release_delivery_slot(delivery_slot_id)
+        if hub:
+            release_inventory(hub["id"], items)
+        raise
+    return {"message": "Order placed successfully", "order_id": order_dict["id"]}
+
+@app.get("/api/products/{product_id}/related")
+async def get_related_products(product_id: str, limit: int = 6):
+    related = []
+    for neighbour in recommendation_cache.get(product_id):
+        product = catalog_cache.get(neighbour["product_id"])
+        if product:
+            related.append({**product, "confidence": neighbour["confidence"]})
+            if len(related) >= limit:
+                break
+    return {"products": related}
+
+# Plain `def` so checkouts run on the threadpool and concurrent ones can share a group commit
 @app.post("/api/customer/orders")
-async def place_order(order: Order, current_user: dict = Depends(verify_token)):
+def place_order(
+    order: Order,
+    response: Response,
+    current_user: dict = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     if current_user.get("role") != "customer":
         raise HTTPException(status_code=403, detail="Customer access required")
     
-    order_dict = order.dict()
-    order_dict["id"] = str(uuid.uuid4())
-    order_dict["customer_id"] = current_user["user_id"]
-    order_dict["created_at"] = datetime.utcnow()
-    order_dict["status"] = "pending"
+    def create():
+        order_dict = order.dict()
+        items = snapshot_order_items(order_dict["items"])
+        return insert_order(
+            current_user["user_id"], items,
+            order.delivery_slot_id, order.delivery_location, order.coupon_code
+        )
     
-    db.orders.insert_one(order_dict)
-    return {"message": "Order placed successfully", "order_id": order_dict["id"]}
+    request_hash = hashlib.sha256(order.json().encode('utf-8')).hexdigest()
+    return run_idempotent(current_user["user_id"], idempotency_key, request_hash, response, create)
 
 @app.get("/api/customer/orders")
-async def get_customer_orders(current_user: dict = Depends(verify_token)):
+async def get_customer_orders(include_archived: bool = False, current_user: dict = Depends(verify_token)):
     if current_user.get("role") != "customer":
         raise HTTPException(status_code=403, detail="Customer access required")
     
-    orders = list(db.orders.find({"customer_id": current_user["user_id"]}, {"_id": 0}))
+    orders = repositories.orders.list(current_user["user_id"], include_archived)
     return {"orders": orders}
 
+# Invoices render in a process pool into a content-addressed cache on disk; the content
+# hash is the ETag, so revalidation is answered without rendering or reading the file
+INVOICE_CACHE_DIR = os.environ.get('INVOICE_CACHE_DIR', '/tmp/meat_delivery/invoices')
+INVOICE_WORKERS = int(os.environ.get('INVOICE_WORKERS', 2))
+INVOICE_SELLER = {
+    "name": os.environ.get('INVOICE_SELLER_NAME', 'Fresh Meat Delivery'),
+    "address": os.environ.get('INVOICE_SELLER_ADDRESS', ''),
+    "tax_id": os.environ.get('INVOICE_SELLER_TAX_ID', ''),
+}
+
+invoice_store = InvoiceStore(INVOICE_CACHE_DIR, INVOICE_WORKERS)
+invoice_prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoice-prefetch")
+
+def order_invoice_payload(order: dict) -> dict:
+    return invoice_payload(order, repositories.customers.get(order["customer_id"]), INVOICE_SELLER)
+
+def pregenerate_invoices(order_ids: List[str]):
+    for order in repositories.orders.get_many(order_ids):
+        try:
+            invoice_store.ensure(order_invoice_payload(order))
+        except Exception:
+            logger.exception("Invoice pre-generation failed for order %s", order["id"])
+
+async def invoice_response(order: dict, request: Request) -> Response:
+    if order["status"] == "cancelled":
+        raise HTTPException(status_code=400, detail="Cancelled orders have no invoice")
+    payload = await run_in_threadpool(order_invoice_payload, order)
+    key = invoice_key(payload)
+    headers = {"ETag": f'"{key}"', "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    content = await invoice_store.get(payload, key)
+    headers["Content-Disposition"] = f'inline; filename="invoice-{order["id"]}.html"'
+    return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
+
+@app.get("/api/customer/orders/{order_id}/invoice")
+async def get_customer_invoice(order_id: str, request: Request, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    
+    # pymongo is blocking, so the lookups run on the threadpool and only rendering is awaited
+    order = await run_in_threadpool(repositories.orders.get, order_id, include_archived=True)
+    if not order or order["customer_id"] != current_user["user_id"]:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return await invoice_response(order, request)
+
+@app.get("/api/admin/orders/{order_id}/invoice")
+async def get_admin_invoice(order_id: str, request: Request, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    order = await run_in_threadpool(repositories.orders.get, order_id, include_archived=True)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return await invoice_response(order, request)
+
+class CartItemUpdate(BaseModel):
+    quantity: int
+
+class CartCheckout(BaseModel):
+    delivery_slot_id: Optional[str] = None
+    delivery_location: Optional[DeliveryLocation] = None
+    coupon_code: Optional[str] = None
+
+def location_param(lat: Optional[float] = None, lng: Optional[float] = None) -> Optional[DeliveryLocation]:
+    """Optional ?lat=&lng= naming where the cart will be delivered, so it is checked against that hub."""
+    if lat is None or lng is None:
+        return None
+    return DeliveryLocation(lat=lat, lng=lng)
+
+@app.get("/api/customer/cart", dependencies=[Depends(requires_mongo)])
+async def get_cart(
+    location: Optional[DeliveryLocation] = Depends(location_param),
+    current_user: dict = Depends(verify_token),
+):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    
+    cart = load_cart(current_user["user_id"])
+    hub = cart_hub(location)
+    if cart["items"] and not cart_is_fresh(cart, hub):
+        cart = save_cart(revalidate_cart(cart, hub))
+    return {"cart": cart}
+
+@app.put("/api/customer/cart/items/{product_id}", dependencies=[Depends(requires_mongo)])
+async def set_cart_item(
+    product_id: str,
+    update: CartItemUpdate,
+    location: Optional[DeliveryLocation] = Depends(location_param),
+    current_user: dict = Depends(verify_token),
+):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    if update.quantity < 0:
+        raise HTTPException(status_code=400, detail="Quantity cannot be negative")
+    
+    cart = load_cart(current_user["user_id"])
+    items = [item for item in cart["items"] if item["product_id"] != product_id]
+    if update.quantity > 0:
+        existing = next((item for item in cart["items"] if item["product_id"] == product_id), {})
+        items.append({"product_id": product_id, "quantity": update.quantity, "price": existing.get("price")})
+    cart["items"] = items
+    return {"cart": save_cart(revalidate_cart(cart, cart_hub(location)))}
+
+@app.delete("/api/customer/cart/items/{product_id}", dependencies=[Depends(requires_mongo)])
+async def remove_cart_item(product_id: str, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    
+    cart = load_cart(current_user["user_id"])
+    cart["items"] = [item for item in cart["items"] if item["product_id"] != product_id]
+    cart["total_amount"] = cart_total(cart["items"])
+    return {"cart": save_cart(cart)}
+
+@app.delete("/api/customer/cart", dependencies=[Depends(requires_mongo)])
+async def clear_cart(current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    
+    db.carts.delete_one({"customer_id": current_user["user_id"]})
+    return {"message": "Cart cleared"}
+
+@app.post("/api/customer/cart/checkout", dependencies=[Depends(requires_mongo)])
+def checkout_cart(
+    response: Response,
+    checkout_data: Optional[CartCheckout] = None,
+    current_user: dict = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if current_user.get("role") != "customer":
+        raise HTTPException(status_code=403, detail="Customer access required")
+    
+    def checkout():
+        cart = load_cart(current_user["user_id"])
+        if not cart["items"]:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        hub = select_hub(checkout_data.delivery_location)
+        # A cart recently validated against the same hub skips the stock pass; a stale one is
+        # revalidated. Either way its prices are re-checked with one batched catalog lookup.
+        if not cart_is_fresh(cart, hub):
+            cart = revalidate_cart(cart, hub)
+        items = None
+        if not cart["issues"]:
+            try:
+                items = snapshot_order_items(cart["items"])
+            except HTTPException:
+                cart = revalidate_cart(cart, hub)
+                if not cart["issues"]:
+                    raise
+        if cart["issues"]:
+            issues = cart["issues"]
+            # Reported once: the saved cart already holds the corrected lines, so checking out
+            # again confirms them
+            cart["issues"] = []
+            save_cart(cart)
+            raise HTTPException(status_code=409, detail={"message": "Cart changed, please review", "issues": issues})
+        if not items:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        # Claim the cart before converting it, so a double-submitted checkout cannot turn the
+        # same cart into two orders; it is put back if the order is not placed
+        claimed = db.carts.find_one_and_delete({"customer_id": current_user["user_id"], "version": cart["version"]})
+        if not claimed:
+            raise HTTPException(status_code=409, detail="Cart was modified or checked out concurrently, please retry")
+        try:
+            return insert_order(
+                current_user["user_id"], items,
+                checkout_data.delivery_slot_id, checkout_data.delivery_location, checkout_data.coupon_code
+            )
+        except Exception:
+            try:
+                db.carts.insert_one(claimed)
+            except DuplicateKeyError:
+                # The customer has started a new cart meanwhile
+                pass
+            raise
+    
+    checkout_data = checkout_data or CartCheckout()
+    request_hash = hashlib.sha256(f"cart-checkout:{checkout_data.json()}".encode('utf-8')).hexdigest()
+    return run_idempotent(current_user["user_id"], idempotency_key, request_hash, response, checkout)
+
+# Delivery slot routes
+class DeliverySlotCapacity(BaseModel):
+    capacity: int
+
+@app.get("/api/delivery-slots", dependencies=[Depends(requires_mongo)])
+async def get_delivery_slots(days: int = DELIVERY_SLOT_DAYS):
+    days = max(1, min(days, DELIVERY_SLOT_DAYS))
+    return {"slots": slot_cache.available(days)}
+
+@app.put("/api/admin/delivery-slots/{slot_id}", dependencies=[Depends(requires_mongo)])
+async def update_delivery_slot(slot_id: str, update: DeliverySlotCapacity, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if update.capacity < 0:
+        raise HTTPException(status_code=400, detail="Capacity cannot be negative")
+    
+    slot = db.delivery_slots.find_one_and_update(
+        {"id": slot_id},
+        {"$set": {"capacity": update.capacity, "updated_at": datetime.utcnow()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not slot:
+        raise HTTPException(status_code=404, detail="Delivery slot not found")
+    slot_cache.apply(slot)
+    return {"message": "Delivery slot updated successfully", "slot": slot}
+
+# Delivery zone routes
+class DeliveryZone(BaseModel):
+    id: Optional[str] = None
+    name: str
+    pincodes: List[str] = []
+    polygon: Optional[List[List[float]]] = None  # [[lng, lat], ...]
+    active: bool = True
+
+def validate_zone(zone: DeliveryZone):
+    if not zone.pincodes and not zone.polygon:
+        raise HTTPException(status_code=400, detail="A zone needs pincodes or a polygon")
+    if zone.polygon and (len(zone.polygon) < 3 or any(len(point) != 2 for point in zone.polygon)):
+        raise HTTPException(status_code=400, detail="Polygon needs at least 3 [lng, lat] points")
+
+@app.get("/api/serviceability", dependencies=[Depends(requires_mongo)])
+async def check_serviceability(pincode: Optional[str] = None, lat: Optional[float] = None, lng: Optional[float] = None):
+    if not pincode and (lat is None or lng is None):
+        raise HTTPException(status_code=400, detail="Provide a pincode or lat and lng")
+    
+    zones = serviceability_cache.current().lookup(pincode=pincode, lat=lat, lng=lng)
+    return {"serviceable": bool(zones), "zones": zones}
+
+@app.get("/api/admin/delivery-zones", dependencies=[Depends(requires_mongo)])
+async def get_delivery_zones(current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"zones": list(db.delivery_zones.find({}, {"_id": 0}))}
+
+@app.post("/api/admin/delivery-zones", dependencies=[Depends(requires_mongo)])
+async def add_delivery_zone(zone: DeliveryZone, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_zone(zone)
+    
+    zone_dict = zone.dict()
+    zone_dict["id"] = str(uuid.uuid4())
+    zone_dict["created_at"] = datetime.utcnow()
+    db.delivery_zones.insert_one(zone_dict)
+    delivery_zones_changed()
+    return {"message": "Delivery zone added successfully", "zone_id": zone_dict["id"]}
+
+@app.put("/api/admin/delivery-zones/{zone_id}", dependencies=[Depends(requires_mongo)])
+async def update_delivery_zone(zone_id: str, zone: DeliveryZone, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_zone(zone)
+    
+    zone_dict = zone.dict()
+    zone_dict["id"] = zone_id
+    zone_dict["updated_at"] = datetime.utcnow()
+    result = db.delivery_zones.update_one({"id": zone_id}, {"$set": zone_dict})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Delivery zone not found")
+    delivery_zones_changed()
+    return {"message": "Delivery zone updated successfully"}
+
+@app.delete("/api/admin/delivery-zones/{zone_id}", dependencies=[Depends(requires_mongo)])
+async def delete_delivery_zone(zone_id: str, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    result = db.delivery_zones.delete_one({"id": zone_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Delivery zone not found")
+    delivery_zones_changed()
+    return {"message": "Delivery zone deleted successfully"}
+
+# Hub routes. Hubs are deactivated rather than deleted, since orders keep their hub_id.
+class Hub(BaseModel):
+    id: Optional[str] = None
+    name: str
+    location: DeliveryLocation
+    zone_ids: List[str] = []
+    active: bool = True
+
+class InventoryLevel(BaseModel):
+    product_id: str
+    stock: int
+
+class InventoryUpdate(BaseModel):
+    items: List[InventoryLevel]
+
+def validate_hub(hub: Hub):
+    zone_ids = set(hub.zone_ids)
+    if zone_ids and db.delivery_zones.count_documents({"id": {"$in": list(zone_ids)}}) != len(zone_ids):
+        raise HTTPException(status_code=400, detail="Unknown delivery zone")
+
+@app.get("/api/admin/hubs", dependencies=[Depends(requires_mongo)])
+async def get_hubs(current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"hubs": list(db.hubs.find({}, {"_id": 0}))}
+
+@app.post("/api/admin/hubs", dependencies=[Depends(requires_mongo)])
+async def add_hub(hub: Hub, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_hub(hub)
+    
+    hub_dict = hub.dict()
+    hub_dict["id"] = str(uuid.uuid4())
+    hub_dict["created_at"] = datetime.utcnow()
+    db.hubs.insert_one(hub_dict)
+    hubs_changed()
+    return {"message": "Hub added successfully", "hub_id": hub_dict["id"]}
+
+@app.put("/api/admin/hubs/{hub_id}", dependencies=[Depends(requires_mongo)])
+async def update_hub(hub_id: str, hub: Hub, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_hub(hub)
+    
+    hub_dict = hub.dict()
+    hub_dict["id"] = hub_id
+    hub_dict["updated_at"] = datetime.utcnow()
+    result = db.hubs.update_one({"id": hub_id}, {"$set": hub_dict})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Hub not found")
+    hubs_changed()
+    hub_catalog_cache.invalidate(hub_id)
+    return {"message": "Hub updated successfully"}
+
+@app.get("/api/admin/hubs/{hub_id}/inventory", dependencies=[Depends(requires_mongo)])
+async def get_hub_inventory(hub_id: str, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not db.hubs.find_one({"id": hub_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Hub not found")
+    
+    return {"hub_id": hub_id, "items": list(db.inventory.find({"hub_id": hub_id}, {"_id": 0}))}
+
+@app.put("/api/admin/hubs/{hub_id}/inventory", dependencies=[Depends(requires_mongo)])
+async def set_hub_inventory(hub_id: str, update: InventoryUpdate, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not db.hubs.find_one({"id": hub_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Hub not found")
+    if not update.items:
+        raise HTTPException(status_code=400, detail="No inventory levels given")
+    if any(level.stock < 0 for level in update.items):
+        raise HTTPException(status_code=400, detail="Stock cannot be negative")
+    levels = {level.product_id: level.stock for level in update.items}
+    product_ids = list(levels)
+    known = repositories.products.get_many(product_ids, [])
+    unknown = [product_id for product_id in product_ids if product_id not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail={"message": "Unknown products", "product_ids": unknown})
+    
+    # Stock counts set absolute levels, one upsert per (hub, product) document
+    now = datetime.utcnow()
+    db.inventory.bulk_write([
+        UpdateOne(
+            {"hub_id": hub_id, "product_id": product_id},
+            {"$set": {"stock": stock, "updated_at": now}},
+            upsert=True
+        )
+        for product_id, stock in levels.items()
+    ], ordered=False)
+    hub_catalog_cache.invalidate(hub_id)
+    return {"message": "Inventory updated successfully", "updated": len(levels)}
+
+# Dispatch batching
+DISPATCH_HUB_LOCATION = DeliveryLocation(
+    lat=float(os.environ.get('DISPATCH_HUB_LAT', 12.9716)),
+    lng=float(os.environ.get('DISPATCH_HUB_LNG', 77.5946))
+)
+
+class DispatchRequest(BaseModel):
+    hub_id: Optional[str] = None
+    hub_location: Optional[DeliveryLocation] = None
+    max_stops: int = 12
+    delivery_slot_id: Optional[str] = None
+
+@app.post("/api/admin/dispatch/batches", dependencies=[Depends(requires_mongo)])
+async def plan_dispatch_batches(request: Optional[DispatchRequest] = None, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    request = request or DispatchRequest()
+    if request.max_stops < 1:
+        raise HTTPException(status_code=400, detail="max_stops must be at least 1")
+    # Riders leave from one hub, so with hubs configured a plan only covers that hub's orders
+    hub = None
+    if request.hub_id:
+        # Read directly, so a deactivated hub's remaining orders can still be dispatched
+        hub = db.hubs.find_one({"id": request.hub_id}, {"_id": 0})
+        if not hub:
+            raise HTTPException(status_code=404, detail="Hub not found")
+    elif hub_directory.current():
+        raise HTTPException(status_code=400, detail="hub_id is required once hubs are configured")
+    
+    orders = repositories.orders.find_by_status(
+        "pending",
+        delivery_slot_id=request.delivery_slot_id,
+        fields=["id", "delivery_location", "delivery_slot"],
+        hub_id=request.hub_id
+    )
+    origin = request.hub_location or (DeliveryLocation(**hub["location"]) if hub else DISPATCH_HUB_LOCATION)
+    plan = plan_batches(orders, (origin.lat, origin.lng), request.max_stops)
+    plan["order_count"] = len(orders)
+    if hub:
+        plan["hub_id"] = hub["id"]
+    return plan
+
+# Promotion routes
+class Promotion(BaseModel):
+    id: Optional[str] = None
+    name: str
+    type: str
+    product_id: Optional[str] = None
+    category: Optional[str] = None
+    code: Optional[str] = None
+    percent_off: Optional[float] = None
+    amount_off: Optional[float] = None
+    max_discount: Optional[float] = None
+    min_cart_total: float = 0
+    buy_quantity: Optional[int] = None
+    free_quantity: Optional[int] = None
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    active: bool = True
+
+def validate_promotion(promotion: Promotion):
+    if promotion.type not in PROMOTION_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(PROMOTION_TYPES)}")
+    if promotion.type == "coupon":
+        if not promotion.code:
+            raise HTTPException(status_code=400, detail="Coupons need a code")
+        if not promotion.percent_off and not promotion.amount_off:
+            raise HTTPException(status_code=400, detail="Coupons need percent_off or amount_off")
+        if promotion.percent_off is not None and not (0 < promotion.percent_off <= 100):
+            raise HTTPException(status_code=400, detail="percent_off must be between 0 and 100")
+        if promotion.amount_off is not None and promotion.amount_off <= 0:
+            raise HTTPException(status_code=400, detail="amount_off must be positive")
+        if promotion.max_discount is not None and promotion.max_discount <= 0:
+            raise HTTPException(status_code=400, detail="max_discount must be positive")
+    elif not promotion.product_id and not promotion.category:
+        raise HTTPException(status_code=400, detail="Promotion needs a product_id or category")
+    if promotion.min_cart_total < 0:
+        raise HTTPException(status_code=400, detail="min_cart_total cannot be negative")
+    if promotion.type == "percent_off" and not (0 < (promotion.percent_off or 0) <= 100):
+        raise HTTPException(status_code=400, detail="percent_off must be between 0 and 100")
+    if promotion.type == "buy_x_get_y" and not ((promotion.buy_quantity or 0) > 0 and (promotion.free_quantity or 0) > 0):
+        raise HTTPException(status_code=400, detail="buy_quantity and free_quantity must be positive")
+
+@app.get("/api/admin/promotions", dependencies=[Depends(requires_mongo)])
+async def get_promotions(current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {"promotions": list(db.promotions.find({}, {"_id": 0}))}
+
+@app.post("/api/admin/promotions", dependencies=[Depends(requires_mongo)])
+async def add_promotion(promotion: Promotion, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_promotion(promotion)
+    
+    promotion_dict = promotion.dict()
+    promotion_dict["id"] = str(uuid.uuid4())
+    promotion_dict["created_at"] = datetime.utcnow()
+    db.promotions.insert_one(promotion_dict)
+    promotions_changed()
+    return {"message": "Promotion added successfully", "promotion_id": promotion_dict["id"]}
+
+@app.put("/api/admin/promotions/{promotion_id}", dependencies=[Depends(requires_mongo)])
+async def update_promotion(promotion_id: str, promotion: Promotion, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    validate_promotion(promotion)
+    
+    promotion_dict = promotion.dict()
+    promotion_dict["id"] = promotion_id
+    promotion_dict["updated_at"] = datetime.utcnow()
+    result = db.promotions.update_one({"id": promotion_id}, {"$set": promotion_dict})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    promotions_changed()
+    return {"message": "Promotion updated successfully"}
+
+@app.delete("/api/admin/promotions/{promotion_id}", dependencies=[Depends(requires_mongo)])
+async def delete_promotion(promotion_id: str, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    result = db.promotions.delete_one({"id": promotion_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    promotions_changed()
+    return {"message": "Promotion deleted successfully"}
+
+# Stock planning
+@app.get("/api/admin/forecast/reorder", dependencies=[Depends(requires_mongo)])
+async def get_reorder_recommendations(hub_id: Optional[str] = None, current_user: dict = Depends(verify_token)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Per-hub forecasts plan against that hub's inventory; "latest" covers the global stock
+    latest = reporting_db.stock_forecasts.find_one({"_id": f"latest:{hub_id}" if hub_id else "latest"}, {"_id": 0})
+    if not latest:
+        raise HTTPException(status_code=404, detail="No forecast yet, run forecast_demand.py")
+    for item in latest["items"]:
+        product = catalog_cache.get(item["product_id"])
+        item["name"] = product["name"] if product else None
+    latest["items"].sort(key=lambda item: item["reorder_quantity"], reverse=True)
+    return latest
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
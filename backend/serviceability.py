@@ -0,0 +1,65 @@
+"""
+In-memory serviceability index for delivery zones.
+Pincodes resolve through a hash map; coordinates go through a uniform grid of polygon
+bounding boxes followed by a point-in-polygon test on the few candidates in that cell.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+Point = Tuple[float, float]  # (lng, lat)
+
+
+def point_in_polygon(lng: float, lat: float, polygon: List[Point]) -> bool:
+    # Ray casting: count crossings of a ray going east from the point
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i]
+        xj, yj = polygon[j]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class ZoneIndex:
+    def __init__(self, zones: List[dict], cell_size: float = 0.05):
+        self.cell_size = cell_size
+        self.zones: Dict[str, dict] = {}
+        self.by_pincode: Dict[str, List[str]] = {}
+        self.grid: Dict[Tuple[int, int], List[Tuple[str, List[Point]]]] = {}
+        for zone in zones:
+            if zone.get("active", True):
+                self._add(zone)
+
+    def _cell(self, lng: float, lat: float) -> Tuple[int, int]:
+        return math.floor(lng / self.cell_size), math.floor(lat / self.cell_size)
+
+    def _add(self, zone: dict):
+        self.zones[zone["id"]] = {"id": zone["id"], "name": zone.get("name")}
+        for pincode in zone.get("pincodes") or []:
+            self.by_pincode.setdefault(str(pincode).strip(), []).append(zone["id"])
+        polygon = [tuple(point) for point in zone.get("polygon") or []]
+        if len(polygon) >= 3:
+            min_x, min_y = self._cell(min(p[0] for p in polygon), min(p[1] for p in polygon))
+            max_x, max_y = self._cell(max(p[0] for p in polygon), max(p[1] for p in polygon))
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    self.grid.setdefault((x, y), []).append((zone["id"], polygon))
+
+    def zones_for_pincode(self, pincode: str) -> List[dict]:
+        return [self.zones[zone_id] for zone_id in self.by_pincode.get(pincode.strip(), [])]
+
+    def zones_for_point(self, lng: float, lat: float) -> List[dict]:
+        return [
+            self.zones[zone_id]
+            for zone_id, polygon in self.grid.get(self._cell(lng, lat), [])
+            if point_in_polygon(lng, lat, polygon)
+        ]
+
+    def lookup(self, pincode: Optional[str] = None, lat: Optional[float] = None, lng: Optional[float] = None) -> List[dict]:
+        matches = self.zones_for_pincode(pincode) if pincode else []
+        if lat is not None and lng is not None:
+            seen = {zone["id"] for zone in matches}
+            matches += [zone for zone in self.zones_for_point(lng, lat) if zone["id"] not in seen]
+        return matches
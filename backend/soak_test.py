@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Soak test: replay a mixed storefront and admin workload against the app in-process and watch
+the worker's memory while it runs.
+
+Every --sample-every requests it records tracemalloc's traced size, RSS, open server cursors
+and connection-pool counters. Growth is the least-squares slope of those samples after the
+warm-up, scaled to 10k requests; the run fails if traced memory or RSS grows faster than the
+thresholds, or if any request fails with a 5xx. The report ends with the allocation sites that
+grew most between the post-warm-up and final snapshots.
+
+Runs against MONGO_URL, like the server. It seeds its own products and customers, tagged with
+the run id, and removes them (with their orders, carts and sessions) when it finishes. Point
+it at a scratch deployment all the same. A few hours of traffic can be compressed into
+--requests; use --duration to soak on the clock instead.
+"""
+import argparse
+import json
+import linecache
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo import monitoring
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection-pool counters across every pool the app's MongoClient opens."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "open": counts.get("created", 0) - counts.get("closed", 0),
+            "checked_out": counts.get("checked_out", 0) - counts.get("checked_in", 0),
+            "created": counts.get("created", 0),
+            "checkout_failed": counts.get("checkout_failed", 0),
+            "cleared": counts.get("cleared", 0),
+        }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("cleared")
+
+    def connection_created(self, event):
+        self._count("created")
+
+    def connection_closed(self, event):
+        self._count("closed")
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._count("checked_out")
+
+    def connection_checked_in(self, event):
+        self._count("checked_in")
+
+# Registered before the server module builds its client, which picks up global listeners
+pool_stats = PoolStats()
+monitoring.register(pool_stats)
+# Per-request access lines would drown the progress output; LOG_LEVEL=INFO soaks them too
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.testclient import TestClient
+
+import server
+from server import Product, app, customer_search_fields, db, issue_tokens, repositories
+
+CATEGORIES = ["chicken", "mutton", "fish", "seafood", "eggs", "marinades"]
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # Peak rather than current RSS off Linux, still good enough to show a trend
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def open_server_cursors():
+    try:
+        return db.command("serverStatus")["metrics"]["cursor"]["open"]["total"]
+    except Exception:
+        return None
+
+def slope_per_10k(points: list) -> float:
+    """Least-squares growth in bytes per 10k requests over (requests, bytes) points."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread * 10000
+
+class Soak:
+    def __init__(self, client: TestClient, run_id: str, products: int, customers: int):
+        self.client = client
+        self.run_id = run_id
+        self.product_ids = [f"soak-{run_id}-{i}" for i in range(products)]
+        self.customers = []
+        self.admin_headers = None
+        self.statuses = Counter()
+        self.server_errors = Counter()
+        self._lock = threading.Lock()
+        self.customer_count = customers
+
+    def seed(self):
+        for i, product_id in enumerate(self.product_ids):
+            repositories.products.add({
+                "id": product_id,
+                "name": f"Soak product {i}",
+                "description": "Soak test product",
+                "price": float(random.randint(99, 999)),
+                "category": random.choice(CATEGORIES),
+                "image": "",
+                "stock": 1000000,
+                "weight": "500g",
+                "created_at": datetime.utcnow(),
+            })
+        server.catalog_cache.invalidate()
+        for i in range(self.customer_count):
+            customer = {
+                "id": str(uuid.uuid4()),
+                "name": f"Soak Customer {i}",
+                "email": f"soak-{self.run_id}-{i}@example.com",
+                "phone": f"9{i:09d}",
+                "password": b"",
+                "created_at": datetime.utcnow(),
+            }
+            customer.update(customer_search_fields(customer))
+            repositories.customers.add(customer)
+            tokens = issue_tokens(customer["id"], "customer")
+            self.customers.append({
+                "id": customer["id"],
+                "headers": {"Authorization": f"Bearer {tokens['access_token']}"},
+                "refresh_token": tokens["refresh_token"],
+                "order_ids": [],
+            })
+        admin = repositories.admins.get_by_username("shiv")
+        self.admin_headers = {"Authorization": f"Bearer {issue_tokens(admin['id'], 'admin')['access_token']}"}
+
+    def cleanup(self):
+        customer_ids = [customer["id"] for customer in self.customers]
+        db.products.delete_many({"id": {"$in": self.product_ids}})
+        db.customers.delete_many({"id": {"$in": customer_ids}})
+        for collection, field in (
+            (db.orders, "customer_id"), (db.orders_archive, "customer_id"),
+            (db.carts, "customer_id"), (db.refresh_tokens, "user_id"),
+        ):
+            collection.delete_many({field: {"$in": customer_ids}})
+        db.idempotency_keys.delete_many({"key": {"$regex": f":soak-{self.run_id}-"}})
+        db.admin_audit.delete_many({"entity_id": {"$in": self.product_ids}})
+        server.catalog_cache.invalidate()
+
+    def call(self, method: str, path: str, **kwargs):
+        response = self.client.request(method, path, **kwargs)
+        with self._lock:
+            self.statuses[response.status_code] += 1
+            if response.status_code >= 500:
+                self.server_errors[f"{method} {path.split('?')[0]}"] += 1
+        return response
+
+    # Scenarios, each a few requests a real session would make together
+
+    def browse(self, customer):
+        self.call("GET", "/api/products")
+        self.call("GET", f"/api/products/{random.choice(self.product_ids)}/related")
+
+    def product_batch(self, customer):
+        ids = ",".join(random.sample(self.product_ids, min(10, len(self.product_ids))))
+        self.call("GET", f"/api/products/batch?ids={ids}")
+
+    def serviceability(self, customer):
+        self.call("GET", f"/api/serviceability?lat={12.9 + random.random() * 0.2}&lng={77.5 + random.random() * 0.2}")
+        self.call("GET", "/api/delivery-slots")
+
+    def cart(self, customer):
+        product_id = random.choice(self.product_ids)
+        self.call("PUT", f"/api/customer/cart/items/{product_id}", json={"quantity": random.randint(1, 3)}, headers=customer["headers"])
+        self.call("GET", "/api/customer/cart", headers=customer["headers"])
+
+    def checkout(self, customer):
+        self.call("PUT", f"/api/customer/cart/items/{random.choice(self.product_ids)}", json={"quantity": 1}, headers=customer["headers"])
+        response = self.call(
+            "POST", "/api/customer/cart/checkout",
+            json={"delivery_location": self.location()},
+            headers={**customer["headers"], "Idempotency-Key": f"soak-{self.run_id}-{uuid.uuid4().hex}"}
+        )
+        if response.status_code == 200:
+            customer["order_ids"].append(response.json()["order_id"])
+
+    def place_order(self, customer):
+        # Priced like the storefront shows them; orders at a stale price are sent back with a 409
+        products = server.catalog_cache.get_many(random.sample(self.product_ids, min(3, len(self.product_ids))))
+        items = [
+            {"product_id": product_id, "quantity": random.randint(1, 3), "price": product["price"]}
+            for product_id, product in products.items()
+        ]
+        response = self.call(
+            "POST", "/api/customer/orders",
+            json={"items": items, "total_amount": sum(i["price"] * i["quantity"] for i in items), "delivery_location": self.location()},
+            headers={**customer["headers"], "Idempotency-Key": f"soak-{self.run_id}-{uuid.uuid4().hex}"}
+        )
+        if response.status_code == 200:
+            customer["order_ids"].append(response.json()["order_id"])
+
+    def order_history(self, customer):
+        self.call("GET", "/api/customer/orders", headers=customer["headers"])
+
+    def invoice(self, customer):
+        if customer["order_ids"]:
+            self.call("GET", f"/api/customer/orders/{random.choice(customer['order_ids'])}/invoice", headers=customer["headers"])
+
+    def refresh_session(self, customer):
+        response = self.call("POST", "/api/auth/refresh", json={"refresh_token": customer["refresh_token"]})
+        if response.status_code == 200:
+            tokens = response.json()
+            customer["headers"] = {"Authorization": f"Bearer {tokens['access_token']}"}
+            customer["refresh_token"] = tokens["refresh_token"]
+
+    def admin_orders(self, customer):
+        self.call("GET", "/api/admin/orders/queue?status=pending&limit=20", headers=self.admin_headers)
+        # Only this run's orders are moved: cancelling releases slots and stock, and the queue
+        # may hold real orders
+        order_ids = customer["order_ids"][-5:]
+        if order_ids:
+            target = random.choice(["confirmed", "cancelled"])
+            self.call("POST", "/api/admin/orders/status", json={"order_ids": order_ids, "status": target}, headers=self.admin_headers)
+
+    def admin_search(self, customer):
+        query = f"soak customer {random.randrange(self.customer_count)}"
+        self.call("GET", "/api/admin/customers/search", params={"q": query}, headers=self.admin_headers)
+        self.call("GET", "/api/admin/dashboard", headers=self.admin_headers)
+
+    def admin_product_update(self, customer):
+        product_id = random.choice(self.product_ids)
+        product = repositories.products.get(product_id)
+        update = {field: product.get(field) for field in Product.model_fields}
+        update["price"] = float(random.randint(99, 999))
+        self.call("PUT", f"/api/admin/products/{product_id}", json=update, headers=self.admin_headers)
+
+    @staticmethod
+    def location() -> dict:
+        return {"lat": 12.9 + random.random() * 0.2, "lng": 77.5 + random.random() * 0.2}
+
+    def workload(self) -> list:
+        return [
+            (self.browse, 30),
+            (self.product_batch, 10),
+            (self.serviceability, 6),
+            (self.cart, 12),
+            (self.checkout, 4),
+            (self.place_order, 6),
+            (self.order_history, 10),
+            (self.invoice, 2),
+            (self.refresh_session, 2),
+            (self.admin_orders, 3),
+            (self.admin_search, 2),
+            (self.admin_product_update, 1),
+        ]
+
+    def requests_made(self) -> int:
+        with self._lock:
+            return sum(self.statuses.values())
+
+def sample(soak: Soak, started: float) -> dict:
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "requests": soak.requests_made(),
+        "elapsed_s": round(time.monotonic() - started, 1),
+        "traced_bytes": traced,
+        "traced_peak_bytes": peak,
+        "rss_bytes": rss_bytes(),
+        "open_cursors": open_server_cursors(),
+        "pool": pool_stats.snapshot(),
+    }
+
+def top_allocators(baseline: tracemalloc.Snapshot, final: tracemalloc.Snapshot, limit: int) -> list:
+    ignored = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, linecache.__file__),
+    ]
+    stats = final.filter_traces(ignored).compare_to(baseline.filter_traces(ignored), "traceback")
+    report = []
+    for stat in stats[:limit]:
+        if stat.size_diff <= 0:
+            break
+        report.append({
+            "size_diff_bytes": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "traceback": stat.traceback.format(limit=8),
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000, help="stop after this many requests")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=5000, help="requests before the baseline snapshot")
+    parser.add_argument("--sample-every", type=int, default=2000, help="requests between samples")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--max-growth-kb", type=float, default=256, help="traced memory growth allowed per 10k requests")
+    parser.add_argument("--max-rss-growth-kb", type=float, default=2048, help="RSS growth allowed per 10k requests")
+    parser.add_argument("--top", type=int, default=15, help="allocation sites in the report")
+    parser.add_argument("--frames", type=int, default=8, help="traceback depth recorded per allocation")
+    parser.add_argument("--report", help="also write samples and allocators to this JSON file")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    if server.STORAGE_BACKEND != "mongo":
+        # Cart, slot and zone scenarios and the clean-up all go to Mongo
+        parser.error(f"needs STORAGE_BACKEND=mongo, not {server.STORAGE_BACKEND}")
+
+    random.seed(args.seed)
+    tracemalloc.start(args.frames)
+    run_id = uuid.uuid4().hex[:8]
+    started = time.monotonic()
+    samples, baseline = [], None
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        soak = Soak(client, run_id, args.products, args.customers)
+        soak.seed()
+        scenarios, weights = zip(*soak.workload())
+        # Each worker owns a slice of the customers, so one session is never used concurrently
+        slices = [soak.customers[i::args.concurrency] for i in range(args.concurrency)]
+        stop = threading.Event()
+
+        def worker(customers: list):
+            while not stop.is_set():
+                random.choices(scenarios, weights)[0](random.choice(customers))
+
+        def done() -> bool:
+            if args.duration is not None:
+                return time.monotonic() - started >= args.duration
+            return soak.requests_made() >= args.requests
+
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                futures = [pool.submit(worker, customers) for customers in slices if customers]
+                next_sample = args.warmup
+                while not done():
+                    time.sleep(0.05)
+                    if any(future.done() for future in futures):
+                        break
+                    if soak.requests_made() < next_sample:
+                        continue
+                    if baseline is None:
+                        baseline = tracemalloc.take_snapshot()
+                    samples.append(sample(soak, started))
+                    latest = samples[-1]
+                    print(
+                        f"{latest['requests']:>8} requests  {latest['elapsed_s']:>8.0f}s  "
+                        f"traced {latest['traced_bytes'] / 2**20:7.1f} MiB  rss {latest['rss_bytes'] / 2**20:7.1f} MiB  "
+                        f"pool {latest['pool']['open']} open/{latest['pool']['checked_out']} out  "
+                        f"cursors {latest['open_cursors']}",
+                        flush=True
+                    )
+                    next_sample = latest["requests"] + args.sample_every
+                stop.set()
+                for future in futures:
+                    future.result()
+            final = tracemalloc.take_snapshot()
+            samples.append(sample(soak, started))
+        finally:
+            stop.set()
+            soak.cleanup()
+
+    traced_growth = slope_per_10k([(s["requests"], s["traced_bytes"]) for s in samples])
+    rss_growth = slope_per_10k([(s["requests"], s["rss_bytes"]) for s in samples])
+    allocators = top_allocators(baseline or final, final, args.top)
+
+    print(f"\n{soak.requests_made()} requests in {samples[-1]['elapsed_s']:.0f}s, statuses {dict(sorted(soak.statuses.items()))}")
+    print(f"traced memory growth: {traced_growth / 1024:.1f} KiB per 10k requests (limit {args.max_growth_kb:.0f})")
+    print(f"RSS growth:           {rss_growth / 1024:.1f} KiB per 10k requests (limit {args.max_rss_growth_kb:.0f})")
+    print("\nTop allocators since the post-warm-up baseline:")
+    for entry in allocators:
+        print(f"\n+{entry['size_diff_bytes'] / 1024:.1f} KiB in {entry['count_diff']:+d} blocks")
+        print("\n".join(entry["traceback"]))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "run_id": run_id,
+                "args": vars(args),
+                "statuses": soak.statuses,
+                "server_errors": soak.server_errors,
+                "traced_growth_per_10k_bytes": traced_growth,
+                "rss_growth_per_10k_bytes": rss_growth,
+                "samples": samples,
+                "top_allocators": allocators,
+            }, f, indent=2, default=str)
+
+    failures = []
+    if len(samples) < 3:
+        failures.append(f"only {len(samples)} samples after warm-up, run longer or sample more often")
+    if traced_growth > args.max_growth_kb * 1024:
+        failures.append("traced memory grew past the limit")
+    if rss_growth > args.max_rss_growth_kb * 1024:
+        failures.append("RSS grew past the limit")
+    if soak.server_errors:
+        failures.append(f"server errors: {dict(soak.server_errors)}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+# Guarded: invoice rendering spawns worker processes, which re-import this module
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Structured, non-blocking logging.
+Handlers only put records on a bounded queue (dropping, never blocking, when it is full);
+a QueueListener thread formats them as one JSON object per line and writes them out. The
+request id, route and accumulated Mongo command time of the current request travel in
+context variables, so every line logged while serving a request — including pymongo command
+timings — carries the same request id. Debug lines are sampled per request and per route.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+route_var: ContextVar[Optional[str]] = ContextVar("route", default=None)
+debug_sampled_var: ContextVar[bool] = ContextVar("debug_sampled", default=False)
+# {"commands": int, "ms": float} for the current request, filled in by CommandTimer
+mongo_stats_var: ContextVar[Optional[dict]] = ContextVar("mongo_stats", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is logged as a field
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "route"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "route", None):
+            entry["route"] = record.route
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request context and drops debug lines of unsampled requests."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        if record.levelno <= logging.DEBUG and record.request_id is not None:
+            return debug_sampled_var.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler over a bounded queue: when the writer falls behind, lines are dropped, not waited on."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now, while the arguments are still valid, but leave
+        # the JSON formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugSampler:
+    """Per-route debug sampling rates, longest matching path prefix wins."""
+
+    def __init__(self, rates: Dict[str, float], default: float = 0.0):
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default = default
+
+    @classmethod
+    def from_spec(cls, spec: str, default: float = 0.0) -> "DebugSampler":
+        """Parse "/api/customer/orders=1,/api/products=0.01"."""
+        rates = {}
+        for part in filter(None, (part.strip() for part in spec.split(","))):
+            prefix, _, rate = part.partition("=")
+            rates[prefix.strip()] = float(rate)
+        return cls(rates, default)
+
+    def rate(self, path: str) -> float:
+        for prefix, rate in self.rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default
+
+    def sample(self, path: str) -> bool:
+        rate = self.rate(path)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times pymongo commands and attributes them to the request that issued them.
+
+    Listener callbacks run synchronously in the thread issuing the command, so the request's
+    context variables are visible here.
+    """
+
+    def __init__(self, slow_ms: float, logger: logging.Logger):
+        self.slow_ms = slow_ms
+        self.logger = logger
+
+    def started(self, event):
+        pass
+
+    def _finished(self, event, failure=None):
+        duration_ms = event.duration_micros / 1000
+        stats = mongo_stats_var.get()
+        if stats is not None:
+            stats["commands"] += 1
+            stats["ms"] += duration_ms
+        level = logging.WARNING if failure is not None or duration_ms >= self.slow_ms else logging.DEBUG
+        if self.logger.isEnabledFor(level):
+            self.logger.log(
+                level,
+                "mongo %s %s",
+                event.command_name,
+                "failed" if failure is not None else "ok",
+                extra={
+                    "command": event.command_name,
+                    "database": event.database_name,
+                    "duration_ms": round(duration_ms, 2),
+                    "failure": failure,
+                },
+            )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event, event.failure)
+
+
+def configure_logging(level: str = "INFO", queue_size: int = 10000, stream=None):
+    """Route the root logger through a bounded queue to a JSON writer thread; returns (listener, handler)."""
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    return listener, queue_handler
+
+
+def start_request(request_id: str, route: str, debug_sampled: bool) -> dict:
+    """Bind the request context for the current task; returns its Mongo stats accumulator."""
+    stats = {"commands": 0, "ms": 0.0}
+    request_id_var.set(request_id)
+    route_var.set(route)
+    debug_sampled_var.set(debug_sampled)
+    mongo_stats_var.set(stats)
+    return stats
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
@@ -3,6 +3,52 @@ import './App.css';
 
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
+// Refresh tokens rotate on every use, so concurrent 401s share one renewal instead of each
+// presenting the same token
+let refreshInFlight = null;
+
+const refreshSession = () => {
+  const refreshToken = localStorage.getItem('refreshToken');
+  if (!refreshToken) {
+    return Promise.resolve(null);
+  }
+  if (!refreshInFlight) {
+    refreshInFlight = fetch(`${API_BASE_URL}/api/auth/refresh`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh_token: refreshToken })
+    })
+      .then(async (response) => {
+        if (!response.ok) {
+          return null;
+        }
+        const data = await response.json();
+        localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refreshToken', data.refresh_token);
+        return data.access_token;
+      })
+      .catch(() => null)
+      .finally(() => {
+        refreshInFlight = null;
+      });
+  }
+  return refreshInFlight;
+};
+
+// Orders ship from the hub serving the customer's location; without one the server falls back
+// to its default hub
+const currentLocation = () => new Promise((resolve) => {
+  if (!navigator.geolocation) {
+    resolve(null);
+    return;
+  }
+  navigator.geolocation.getCurrentPosition(
+    (position) => resolve({ lat: position.coords.latitude, lng: position.coords.longitude }),
+    () => resolve(null),
+    { timeout: 5000, maximumAge: 10 * 60 * 1000 }
+  );
+});
+
 function App() {
   const [currentView, setCurrentView] = useState('home');
   const [userType, setUserType] = useState(null);
@@ -52,6 +98,29 @@ function App() {
     }
   }, [token]);
 
+  // Authorized fetch: access tokens are short-lived, so renew once with the refresh token on 401
+  const authFetch = async (url, options = {}) => {
+    const send = (accessToken) => fetch(url, {
+      ...options,
+      headers: { ...(options.headers || {}), 'Authorization': `Bearer ${accessToken}` }
+    });
+    let response = await send(token);
+    // Another request or tab may already have renewed the session
+    const stored = localStorage.getItem('token');
+    if (response.status === 401 && stored && stored !== token) {
+      setToken(stored);
+      response = await send(stored);
+    }
+    if (response.status === 401) {
+      const accessToken = await refreshSession();
+      if (accessToken) {
+        setToken(accessToken);
+        response = await send(accessToken);
+      }
+    }
+    return response;
+  };
+
   // Fetch products
   const fetchProducts = async () => {
     try {
@@ -87,7 +156,7 @@ function App() {
   // Fetch admin dashboard stats
   const fetchDashboardStats = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/admin/dashboard`, {
+      const response = await authFetch(`${API_BASE_URL}/api/admin/dashboard`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
@@ -100,7 +169,7 @@ function App() {
   // Fetch customers for admin
   const fetchCustomers = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/admin/customers`, {
+      const response = await authFetch(`${API_BASE_URL}/api/admin/customers`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
@@ -113,7 +182,7 @@ function App() {
   // Fetch orders for admin
   const fetchOrders = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/admin/orders`, {
+      const response = await authFetch(`${API_BASE_URL}/api/admin/orders`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
@@ -137,6 +206,7 @@ function App() {
       if (response.ok) {
         setToken(data.access_token);
         localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refreshToken', data.refresh_token);
         setUserType('admin');
         setCurrentView('admin-dashboard');
         setAdminForm({ username: '', password: '' });
@@ -162,6 +232,7 @@ function App() {
       if (response.ok) {
         setToken(data.access_token);
         localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refreshToken', data.refresh_token);
         localStorage.setItem('customerName', data.customer_name);
         setCustomerName(data.customer_name);
         setUserType('customer');
@@ -189,6 +260,7 @@ function App() {
       if (response.ok) {
         setToken(data.access_token);
         localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refreshToken', data.refresh_token);
         setUserType('customer');
         setCurrentView('customer-products');
         setCustomerRegisterForm({ name: '', email: '', password: '', phone: '' });
@@ -204,7 +276,7 @@ function App() {
   const handleAddProduct = async (e) => {
     e.preventDefault();
     try {
-      const response = await fetch(`${API_BASE_URL}/api/admin/products`, {
+      const response = await authFetch(`${API_BASE_URL}/api/admin/products`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -268,8 +340,9 @@ function App() {
         quantity: item.quantity,
         price: item.price
       }));
+      const deliveryLocation = await currentLocation();
 
-      const response = await fetch(`${API_BASE_URL}/api/customer/orders`, {
+      const response = await authFetch(`${API_BASE_URL}/api/customer/orders`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -277,7 +350,8 @@ function App() {
         },
         body: JSON.stringify({
           items: orderItems,
-          total_amount: totalAmount
+          total_amount: totalAmount,
+          ...(deliveryLocation && { delivery_location: deliveryLocation })
         })
       });
 
@@ -286,7 +360,8 @@ function App() {
         setCart([]);
         setCurrentView('customer-products');
       } else {
-        alert('Failed to place order');
+        const data = await response.json().catch(() => ({}));
+        alert(typeof data.detail === 'string' ? data.detail : 'Failed to place order');
       }
     } catch (error) {
       alert('Failed to place order');
@@ -295,10 +370,25 @@ function App() {
 
   // Logout
   const handleLogout = () => {
+    // The refresh token identifies the session even once the access token has expired
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      fetch(`${API_BASE_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken })
+      }).catch(() => {});
+    } else if (token) {
+      fetch(`${API_BASE_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}` }
+      }).catch(() => {});
+    }
     setToken(null);
     setUserType(null);
     setCustomerName(null);
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('customerName');
     setCurrentView('home');
     setCart([]);
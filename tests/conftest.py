@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# The API runs entirely in-process: repositories and auth sessions in memory, and a Mongo URL
+# nothing listens on, so any stray database access fails fast instead of passing silently
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["MONGO_URL"] = "mongodb://127.0.0.1:1"
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "200")
+# Tests log the same accounts in many times from one address
+os.environ.setdefault("LOGIN_IP_BURST", "1000")
+os.environ.setdefault("LOGIN_ACCOUNT_BURST", "1000")
+os.environ.setdefault("INVOICE_CACHE_DIR", tempfile.mkdtemp(prefix="invoices-"))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "backend"))
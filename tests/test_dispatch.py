@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from dispatch import haversine_km, plan_batches, sequence_run, sweep_runs
+
+HUB = (12.97, 77.59)
+
+
+def order(order_id, lat, lng, slot_id=None):
+    return {"id": order_id, "delivery_location": {"lat": lat, "lng": lng}, "delivery_slot": {"id": slot_id} if slot_id else None}
+
+
+def test_haversine_km():
+    assert float(haversine_km(12.97, 77.59, 12.97, 77.59)) == 0.0
+    # One degree of latitude is about 111 km
+    assert float(haversine_km(12.0, 77.0, 13.0, 77.0)) == pytest.approx(111.19, abs=0.1)
+
+
+def test_sweep_keeps_directions_together_and_caps_stops():
+    # Three orders north of the hub and three south
+    lat = np.array([13.00, 12.94, 13.01, 12.93, 13.02, 12.92])
+    lng = np.array([77.59, 77.59, 77.60, 77.60, 77.58, 77.58])
+    runs = sweep_runs(lat, lng, HUB, max_stops=3)
+    assert sorted(sorted(run.tolist()) for run in runs) == [[0, 2, 4], [1, 3, 5]]
+    assert all(len(run) <= 3 for run in sweep_runs(lat, lng, HUB, max_stops=2))
+    assert sweep_runs(np.array([]), np.array([]), HUB, max_stops=3) == []
+
+
+def test_sweep_does_not_split_a_cluster_across_the_seam():
+    # Due west of the hub, where arctan2 wraps from +pi to -pi
+    lat = np.array([12.971, 12.969, 12.972, 12.968])
+    lng = np.array([77.50, 77.50, 77.51, 77.51])
+    assert len(sweep_runs(lat, lng, HUB, max_stops=4)) == 1
+
+
+def test_sequence_run_visits_nearest_first_and_returns_to_hub():
+    lat = np.array([13.03, 12.99, 13.01])
+    lng = np.array([77.59, 77.59, 77.59])
+    route, total = sequence_run(lat, lng, HUB)
+    assert route == [1, 2, 0]
+    assert total == pytest.approx(2 * float(haversine_km(HUB[0], HUB[1], 13.03, 77.59)), rel=1e-6)
+
+
+def test_plan_batches_keeps_slots_apart_and_reports_unroutable():
+    orders = [
+        order("a", 13.00, 77.59, "morning"),
+        order("b", 13.01, 77.59, "evening"),
+        order("c", 13.02, 77.59, "morning"),
+        {"id": "d", "delivery_location": None},
+    ]
+    plan = plan_batches(orders, HUB, max_stops=12)
+    assert plan["unroutable_order_ids"] == ["d"]
+    assert {batch["delivery_slot_id"]: batch["order_ids"] for batch in plan["batches"]} == {
+        "morning": ["a", "c"],
+        "evening": ["b"],
+    }
+    assert all(batch["stops"] == len(batch["order_ids"]) for batch in plan["batches"])
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteConcernError
+
+from group_commit import GroupCommitWriter
+
+
+class FakeCollection:
+    def __init__(self, errors=None, concern_errors=None, gate=None):
+        self.batches = []
+        self.errors = errors or {}
+        self.concern_errors = concern_errors or []
+        self.gate = gate
+
+    def insert_many(self, documents, ordered=True):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batches.append([document["n"] for document in documents])
+        write_errors = [
+            {"index": index, "code": self.errors[document["n"]], "errmsg": f"failed {document['n']}"}
+            for index, document in enumerate(documents) if document["n"] in self.errors
+        ]
+        if write_errors or self.concern_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "writeConcernErrors": self.concern_errors})
+
+
+def test_concurrent_inserts_share_one_batch():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(lambda: collection, max_batch=10, max_delay=0.2)
+    futures = [writer.submit({"n": n}) for n in range(5)]
+    for future in futures:
+        assert future.result(5) is None
+    assert collection.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_max_batch_splits_groups():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(lambda: collection, max_batch=2, max_delay=0.2)
+    futures = [writer.submit({"n": n}) for n in range(5)]
+    for future in futures:
+        future.result(5)
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+
+
+def test_bulk_errors_fail_only_their_own_document():
+    collection = FakeCollection(errors={1: 11000, 2: 121})
+    writer = GroupCommitWriter(lambda: collection, max_batch=10, max_delay=0.2)
+    futures = [writer.submit({"n": n}) for n in range(4)]
+    assert futures[0].result(5) is None
+    with pytest.raises(DuplicateKeyError):
+        futures[1].result(5)
+    error = futures[2].exception(5)
+    assert type(error) is OperationFailure and error.code == 121
+    assert futures[3].result(5) is None
+
+
+def test_write_concern_error_fails_the_written_documents():
+    collection = FakeCollection(concern_errors=[{"code": 64, "errmsg": "waiting for replication timed out"}])
+    writer = GroupCommitWriter(lambda: collection, max_batch=10, max_delay=0.05)
+    with pytest.raises(WriteConcernError):
+        writer.insert({"n": 0})
+
+
+def test_unexpected_errors_fail_the_whole_group():
+    class Broken:
+        def insert_many(self, documents, ordered=True):
+            raise RuntimeError("connection reset")
+
+    writer = GroupCommitWriter(lambda: Broken(), max_batch=10, max_delay=0.05)
+    with pytest.raises(RuntimeError, match="connection reset"):
+        writer.insert({"n": 0})
+
+
+def test_timed_out_queued_document_is_withdrawn_unwritten():
+    gate = threading.Event()
+    collection = FakeCollection(gate=gate)
+    writer = GroupCommitWriter(lambda: collection, max_batch=1, max_delay=0, timeout=0.2)
+    first = writer.submit({"n": 0})  # holds the flusher inside insert_many until the gate opens
+    with pytest.raises(TimeoutError):
+        writer.insert({"n": 1})
+    gate.set()
+    first.result(5)
+    assert writer.drain(5)
+    assert collection.batches == [[0]]
+
+
+def test_timeout_while_being_written_waits_for_the_outcome():
+    gate = threading.Event()
+    collection = FakeCollection(gate=gate)
+    writer = GroupCommitWriter(lambda: collection, max_batch=1, max_delay=0, timeout=0.2)
+    threading.Timer(0.5, gate.set).start()
+    assert writer.insert({"n": 0}) is None
+    assert collection.batches == [[0]]
@@ -0,0 +1,182 @@
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def admin_headers(client):
+    response = client.post("/api/admin/login", json={"username": "shiv", "password": "123"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def customer(client):
+    response = client.post("/api/customer/register", json={
+        "name": "Asha Rao", "email": "asha@example.com", "password": "secret", "phone": "9876543210"
+    })
+    assert response.status_code == 200
+    body = response.json()
+    return {"headers": {"Authorization": f"Bearer {body['access_token']}"}, "refresh_token": body["refresh_token"]}
+
+
+@pytest.fixture(scope="module")
+def product_id(client, admin_headers):
+    response = client.post("/api/admin/products", headers=admin_headers, json={
+        "name": "Chicken Curry Cut", "description": "Skinless", "price": 250, "category": "chicken",
+        "image": "", "stock": 20, "weight": "500g"
+    })
+    assert response.status_code == 200
+    return response.json()["product_id"]
+
+
+def test_ready_without_mongo(client):
+    response = client.get("/api/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+
+def test_admin_login_rejects_wrong_password(client):
+    response = client.post("/api/admin/login", json={"username": "shiv", "password": "nope"})
+    assert response.status_code == 401
+
+
+def test_customer_login_and_refresh(client, customer):
+    response = client.post("/api/customer/login", json={"email": "asha@example.com", "password": "secret"})
+    assert response.status_code == 200
+    response = client.post("/api/auth/refresh", json={"refresh_token": customer["refresh_token"]})
+    assert response.status_code == 200
+    assert response.json()["role"] == "customer"
+
+
+def test_logout_revokes_session(client):
+    tokens = client.post("/api/customer/login", json={"email": "asha@example.com", "password": "secret"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    assert client.get("/api/customer/orders", headers=headers).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_products_listed_from_memory(client, product_id):
+    products = client.get("/api/products").json()["products"]
+    assert [product["id"] for product in products] == [product_id]
+
+
+def test_place_and_list_order(client, customer, product_id):
+    response = client.post("/api/customer/orders", headers=customer["headers"], json={
+        "items": [{"product_id": product_id, "quantity": 2, "price": 250}], "total_amount": 500
+    })
+    assert response.status_code == 200
+    order_id = response.json()["order_id"]
+
+    orders = client.get("/api/customer/orders", headers=customer["headers"]).json()["orders"]
+    assert [(order["id"], order["total_amount"]) for order in orders] == [(order_id, 500)]
+    assert orders[0]["items"][0]["name"] == "Chicken Curry Cut"
+
+
+def test_unknown_product_rejected(client, customer):
+    response = client.post("/api/customer/orders", headers=customer["headers"], json={
+        "items": [{"product_id": "missing", "quantity": 1, "price": 1}], "total_amount": 1
+    })
+    assert response.status_code == 400
+
+
+def test_admin_transitions(client, admin_headers, customer, product_id):
+    order_ids = [
+        client.post("/api/customer/orders", headers=customer["headers"], json={
+            "items": [{"product_id": product_id, "quantity": 1, "price": 250}], "total_amount": 250
+        }).json()["order_id"]
+        for _ in range(2)
+    ]
+
+    response = client.post("/api/admin/orders/status", headers=admin_headers, json={"order_ids": order_ids, "status": "confirmed"})
+    assert sorted(response.json()["updated_order_ids"]) == sorted(order_ids)
+
+    response = client.put(f"/api/admin/orders/{order_ids[0]}/status", headers=admin_headers, json={"status": "delivered"})
+    assert response.status_code == 400
+    response = client.put(f"/api/admin/orders/{order_ids[0]}/status", headers=admin_headers, json={"status": "cancelled"})
+    assert response.status_code == 200
+
+    statuses = {order["id"]: order["status"] for order in client.get("/api/admin/orders", headers=admin_headers).json()["orders"]}
+    assert statuses[order_ids[0]] == "cancelled"
+    assert statuses[order_ids[1]] == "confirmed"
+
+
+def test_login_right_after_logout_all(client):
+    credentials = {"email": "ravi@example.com", "password": "secret"}
+    assert client.post("/api/customer/register", json={**credentials, "name": "Ravi", "phone": "9000000001"}).status_code == 200
+    for _ in range(5):
+        tokens = client.post("/api/customer/login", json=credentials).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert client.post("/api/auth/logout-all", headers=headers).status_code == 200
+        assert client.get("/api/customer/orders", headers=headers).status_code == 401
+
+        tokens = client.post("/api/customer/login", json=credentials).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert client.get("/api/customer/orders", headers=headers).status_code == 200
+
+
+def test_tokens_issued_in_the_revocation_second_stay_valid():
+    for _ in range(20):
+        server.revoke_user_sessions("user-1")
+        tokens = server.issue_tokens("user-1", "customer")
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=tokens["access_token"])
+        assert server.verify_token(credentials)["user_id"] == "user-1"
+
+
+def test_idempotent_order_replayed(client, customer, product_id):
+    body = {"items": [{"product_id": product_id, "quantity": 1, "price": 250}], "total_amount": 250}
+    headers = {**customer["headers"], "Idempotency-Key": "order-once"}
+    first = client.post("/api/customer/orders", headers=headers, json=body)
+    second = client.post("/api/customer/orders", headers=headers, json=body)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+def test_audit_log_records_product_writes(client, admin_headers, product_id):
+    product = client.get(f"/api/products/batch?ids={product_id}").json()["products"][0]
+    response = client.put(f"/api/admin/products/{product_id}", headers=admin_headers, json={**product, "description": "Skinless, cleaned"})
+    assert response.status_code == 200
+    entries = client.get(f"/api/admin/audit?entity_id={product_id}", headers=admin_headers).json()["entries"]
+    assert [entry["action"] for entry in entries] == ["product.update", "product.create"]
+    assert entries[0]["changes"]["description"]["after"] == "Skinless, cleaned"
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/api/customer/cart"),
+    ("get", "/api/delivery-slots"),
+    ("get", "/api/serviceability?lat=12.9&lng=77.6"),
+])
+def test_mongo_only_routes_unavailable(client, customer, method, path):
+    response = getattr(client, method)(path, headers=customer["headers"])
+    assert response.status_code == 503
+
+
+def test_idempotency_key_reaped_mid_claim_is_claimed_again(client, customer, product_id, monkeypatch):
+    keys = server.repositories.idempotency_keys
+    real_claim = keys.claim
+    calls = []
+
+    def claim_after_reaper(entry):
+        # First attempt collides with an entry the TTL reaper removes before it can be read
+        calls.append(entry["key"])
+        if len(calls) == 1:
+            raise server.DuplicateKeyError("reaped meanwhile")
+        real_claim(entry)
+
+    monkeypatch.setattr(keys, "claim", claim_after_reaper)
+    headers = {**customer["headers"], "Idempotency-Key": "reaped"}
+    body = {"items": [{"product_id": product_id, "quantity": 1, "price": 250}], "total_amount": 250}
+    response = client.post("/api/customer/orders", headers=headers, json=body)
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert keys.get(calls[0])["response"] == response.json()
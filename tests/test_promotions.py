@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from promotions import PromotionEngine, PromotionError
+
+NOW = datetime(2026, 10, 1, 12, 0)
+
+
+def line(product_id="p1", quantity=1, price=100.0, category="chicken"):
+    return {"product_id": product_id, "quantity": quantity, "price": price, "category": category}
+
+
+def test_best_line_rule_wins_across_product_and_category():
+    engine = PromotionEngine([
+        {"id": "cat10", "type": "percent_off", "category": "chicken", "percent_off": 10},
+        {"id": "p1-20", "type": "percent_off", "product_id": "p1", "percent_off": 20},
+        {"id": "p1-5", "type": "percent_off", "product_id": "p1", "percent_off": 5},
+    ])
+    result = engine.evaluate([line(quantity=2), line("p2", price=50)], now=NOW)
+    assert [(applied["promotion_id"], applied["amount"]) for applied in result["applied"]] == [("p1-20", 40.0), ("cat10", 5.0)]
+    assert result["total"] == 205.0
+
+
+def test_expired_and_inactive_rules_are_skipped():
+    engine = PromotionEngine([
+        {"id": "old", "type": "percent_off", "product_id": "p1", "percent_off": 50, "ends_at": NOW - timedelta(days=1)},
+        {"id": "off", "type": "percent_off", "product_id": "p1", "percent_off": 40, "active": False},
+        {"id": "soon", "type": "percent_off", "product_id": "p1", "percent_off": 30, "starts_at": NOW + timedelta(days=1)},
+        {"id": "live", "type": "percent_off", "product_id": "p1", "percent_off": 10},
+    ])
+    assert [applied["promotion_id"] for applied in engine.evaluate([line()], now=NOW)["applied"]] == ["live"]
+
+
+def test_buy_x_get_y_counts_whole_groups():
+    engine = PromotionEngine([{"id": "b2g1", "type": "buy_x_get_y", "product_id": "p1", "buy_quantity": 2, "free_quantity": 1}])
+    assert engine.evaluate([line(quantity=7)], now=NOW)["discount_total"] == 200.0
+    assert engine.evaluate([line(quantity=2)], now=NOW)["applied"] == []
+
+
+def test_coupon_applies_to_the_discounted_subtotal_with_cap():
+    engine = PromotionEngine([
+        {"id": "p1-10", "type": "percent_off", "product_id": "p1", "percent_off": 10},
+        {"id": "c", "type": "coupon", "code": "Fresh20", "percent_off": 20, "max_discount": 30},
+    ])
+    result = engine.evaluate([line(quantity=2)], coupon_code=" fresh20 ", now=NOW)
+    assert result["applied"][-1] == {"promotion_id": "c", "name": None, "code": "Fresh20", "amount": 30.0}
+    assert result["total"] == 150.0
+
+
+def test_coupon_minimum_is_checked_after_line_discounts():
+    engine = PromotionEngine([
+        {"id": "p1-50", "type": "percent_off", "product_id": "p1", "percent_off": 50},
+        {"id": "c", "type": "coupon", "code": "BIG", "amount_off": 20, "min_cart_total": 100},
+    ])
+    with pytest.raises(PromotionError, match="minimum order of 100"):
+        engine.evaluate([line()], coupon_code="BIG", now=NOW)
+    assert engine.evaluate([line(quantity=2)], coupon_code="BIG", now=NOW)["total"] == 80.0
+
+
+def test_amount_off_never_exceeds_the_cart():
+    engine = PromotionEngine([{"id": "c", "type": "coupon", "code": "FLAT", "amount_off": 500}])
+    assert engine.evaluate([line()], coupon_code="FLAT", now=NOW)["total"] == 0.0
+
+
+def test_unknown_or_expired_coupon_is_rejected():
+    engine = PromotionEngine([{"id": "c", "type": "coupon", "code": "GONE", "amount_off": 5, "ends_at": NOW}])
+    for code in ("GONE", "NOPE"):
+        with pytest.raises(PromotionError, match="Invalid or expired"):
+            engine.evaluate([line()], coupon_code=code, now=NOW)
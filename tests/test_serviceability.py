@@ -0,0 +1,42 @@
+from serviceability import ZoneIndex, point_in_polygon
+
+SQUARE = [(77.60, 12.90), (77.70, 12.90), (77.70, 13.00), (77.60, 13.00)]
+# An L shape: the square's top-right quarter is cut out
+L_SHAPE = [(77.60, 12.90), (77.70, 12.90), (77.70, 12.95), (77.65, 12.95), (77.65, 13.00), (77.60, 13.00)]
+
+
+def test_point_in_polygon():
+    assert point_in_polygon(77.65, 12.95, SQUARE)
+    assert not point_in_polygon(77.75, 12.95, SQUARE)
+    assert point_in_polygon(77.62, 12.98, L_SHAPE)
+    assert not point_in_polygon(77.68, 12.98, L_SHAPE)
+
+
+def test_lookup_by_point_checks_the_polygon_not_just_the_grid_cell():
+    index = ZoneIndex([{"id": "z1", "name": "Koramangala", "polygon": L_SHAPE}], cell_size=0.5)
+    assert index.lookup(lat=12.98, lng=77.62) == [{"id": "z1", "name": "Koramangala"}]
+    assert index.lookup(lat=12.98, lng=77.68) == []
+
+
+def test_zone_spanning_cells_is_found_from_each():
+    index = ZoneIndex([{"id": "z1", "polygon": SQUARE}], cell_size=0.02)
+    assert [zone["id"] for zone in index.lookup(lat=12.91, lng=77.61)] == ["z1"]
+    assert [zone["id"] for zone in index.lookup(lat=12.99, lng=77.69)] == ["z1"]
+
+
+def test_pincode_and_point_matches_are_merged_without_duplicates():
+    index = ZoneIndex([
+        {"id": "z1", "pincodes": ["560034"], "polygon": SQUARE},
+        {"id": "z2", "pincodes": [560095]},
+    ])
+    assert [zone["id"] for zone in index.lookup(pincode=" 560034 ", lat=12.95, lng=77.65)] == ["z1"]
+    assert [zone["id"] for zone in index.lookup(pincode="560095", lat=12.95, lng=77.65)] == ["z2", "z1"]
+    assert index.lookup(pincode="110001") == []
+
+
+def test_inactive_zones_and_degenerate_polygons_are_ignored():
+    index = ZoneIndex([
+        {"id": "off", "active": False, "pincodes": ["560034"], "polygon": SQUARE},
+        {"id": "line", "polygon": [(77.60, 12.90), (77.70, 13.00)]},
+    ])
+    assert index.lookup(pincode="560034", lat=12.95, lng=77.65) == []